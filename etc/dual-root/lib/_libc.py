@@ -0,0 +1,41 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Access to libc via ctypes.
+
+Loaded once on first use and shared.
+"""
+# pylint: disable=global-statement
+import os
+import ctypes
+
+_LIBC: ctypes.CDLL | None = None
+
+
+def libc() -> ctypes.CDLL:
+    """
+    Return the (cached) C library handle.
+     - errno is preserved so callers can use ctypes.get_errno()
+
+    Raises:
+        OSError if libc cannot be loaded.
+    """
+    global _LIBC
+    if _LIBC is None:
+        try:
+            _LIBC = ctypes.CDLL('libc.so.6', use_errno=True)
+        except OSError:
+            # not on the common path - slow to import
+            # pylint: disable=import-outside-toplevel
+            from ctypes import util as ctypes_util
+            name = ctypes_util.find_library('c')
+            _LIBC = ctypes.CDLL(name, use_errno=True)
+    return _LIBC
+
+
+def errno_error(what: str) -> OSError:
+    """
+    Build OSError from current ctypes errno
+    """
+    errno = ctypes.get_errno()
+    return OSError(errno, f'{what}: {os.strerror(errno)}')
@@ -9,15 +9,25 @@ from .toml import read_toml_file
 
 from ._types import SyncListElem
 
+#
+# Options which may be set for an individual sync list item.
+# Each defaults to the global value of the same name.
+#
+ITEM_OPTIONS = ('sync_delay', 'sync_max_latency',
+                'nice', 'ionice_class', 'ionice_level',
+                'io_weight', 'io_max', 'cpu_weight', 'critical',
+                'rsync_timeout', 'sync_latency_slo')
+
 
 def _elem_to_src_dst(item) -> SyncListElem:
     """
     Put in standard format:
-     [source, [destination(s)], exclusions]
-     exclusions are options.
+     [source, [destination(s)], exclusions, options]
+     exclusions and options are optional.
      dest may be string or list
+     options is a table (dictionary) of per item settings.
     """
-    src_dst_excl: SyncListElem = ('', [], [])
+    src_dst_excl: SyncListElem = ('', [], [], {})
 
     if isinstance(item, list):
 
@@ -30,23 +40,40 @@ def _elem_to_src_dst(item) -> SyncListElem:
             dst = [item[1]]
 
         excl: list[str] = []
-        if len(item) > 2:
-            excl = item[2]
+        opts: dict[str, Any] = {}
+        for elem in item[2:]:
+            if isinstance(elem, dict):
+                opts = _item_options(src, elem)
+            else:
+                excl = elem
 
-        src_dst_excl = (src, dst, excl)
+        src_dst_excl = (src, dst, excl, opts)
 
     return src_dst_excl
 
 
+def _item_options(src: str, opts: dict[str, Any]) -> dict[str, Any]:
+    """
+    Keep the known per item options
+    """
+    item_opts: dict[str, Any] = {}
+    for (key, val) in opts.items():
+        if key in ITEM_OPTIONS:
+            item_opts[key] = val
+        else:
+            print(f'Warning: sync {src} unknown option {key} ignored')
+    return item_opts
+
+
 def _parse_sync_list(item: Sequence[str | list[str]]) -> list[SyncListElem]:
     """
     Takes conf file input and maps it to
-    list of (src, dst, excl)
+    list of (src, dst, excl, opts)
 
     Input file contains sync_list of form:
        [
        [src, dst, excl],
-       [src, dst, excl],
+       [src, dst, excl, opts],
        ]
     """
     sync_list: list[SyncListElem] = []
@@ -56,7 +83,7 @@ def _parse_sync_list(item: Sequence[str | list[str]]) -> list[SyncListElem]:
 
     # num_elems = len(item)
     #
-    # (src, dst, excl)
+    # (src, dst, excl, opts)
     # src: is always path str so never a list.
     #
     if isinstance(item[0], list):
@@ -94,7 +121,28 @@ def read_config(config_file) -> dict[str, Any]:
     # ionice default: none,0
     #   - class: idle(3), none(0), best-effort(2), realtime(1)
     #   - level: 0-7 (0=highest) for realtime and best-effort only
-    # sync_delay - seconds between pending rsync requests
+    # sync_delay - seconds with no changes before syncing
+    # sync_max_latency - max seconds after first change before syncing
+    # sync_latency_slo - warn if first change to synced takes longer (0 = off)
+    # inotify_backend - 'native' (in process) or 'inotifywait'
+    # full_sync_interval - seconds between full tree syncs (0 = never)
+    # rsync_batch - multiple destinations use rsync batch mode
+    # dest_workers - max destination disks synced concurrently
+    # sync_threads - max sync items synced concurrently
+    # cgroup - run rsync of each item in its own cgroup (v2) with:
+    #   io_weight, cpu_weight (1-10000, 0 = unchanged) and io_max limits
+    # pressure_io, pressure_cpu, pressure_memory - defer syncs while PSI
+    #   "some avg10" percent is above this (0 = not checked)
+    # pressure_max_defer - longest a sync is deferred due to pressure
+    # rsync_timeout - longest one rsync may run (0 = no limit)
+    # shutdown_timeout - longest to wait for pending syncs on exit
+    #   before stopping them (0 = no limit)
+    # metrics_file - prometheus textfile to write metrics to ('' = none)
+    # metrics_interval - seconds between metrics file updates
+    # trace_file - write JSON lines spans of daemon hot paths ('' = off)
+    # profile_dir - SIGUSR1 saves cProfile stats here ('' = off)
+    # profile_secs - how long each SIGUSR1 profile runs
+    # event_trace_file - record events handled, for replay ('' = off)
     sync_list: list[SyncListElem] = []
     rsync_opts: list[str] = ["-axHAXt"]
     conf = {
@@ -103,7 +151,30 @@ def read_config(config_file) -> dict[str, Any]:
             'nice': 19,
             'ionice_class': 3,         # 0=idle
             'ionice_level': 6,
-            'sync_delay': 300,
+            'sync_delay': 30,
+            'sync_max_latency': 300,
+            'sync_latency_slo': 0,
+            'inotify_backend': 'native',
+            'full_sync_interval': 86400,
+            'rsync_batch': True,
+            'dest_workers': 4,
+            'sync_threads': 2,
+            'cgroup': False,
+            'io_weight': 0,
+            'io_max': '',
+            'cpu_weight': 0,
+            'pressure_io': 0,
+            'pressure_cpu': 0,
+            'pressure_memory': 0,
+            'pressure_max_defer': 600,
+            'rsync_timeout': 0,
+            'shutdown_timeout': 60,
+            'metrics_file': '',
+            'metrics_interval': 30,
+            'trace_file': '',
+            'profile_dir': '',
+            'profile_secs': 60,
+            'event_trace_file': '',
             'sync_list': sync_list,
             }
 
@@ -113,6 +184,29 @@ def read_config(config_file) -> dict[str, Any]:
         _set_val('ionice_class', conf_file, conf)
         _set_val('ionice_level', conf_file, conf)
         _set_val('sync_delay', conf_file, conf)
+        _set_val('sync_max_latency', conf_file, conf)
+        _set_val('sync_latency_slo', conf_file, conf)
+        _set_val('inotify_backend', conf_file, conf)
+        _set_val('full_sync_interval', conf_file, conf)
+        _set_val('rsync_batch', conf_file, conf)
+        _set_val('dest_workers', conf_file, conf)
+        _set_val('sync_threads', conf_file, conf)
+        _set_val('cgroup', conf_file, conf)
+        _set_val('io_weight', conf_file, conf)
+        _set_val('io_max', conf_file, conf)
+        _set_val('cpu_weight', conf_file, conf)
+        _set_val('pressure_io', conf_file, conf)
+        _set_val('pressure_cpu', conf_file, conf)
+        _set_val('pressure_memory', conf_file, conf)
+        _set_val('pressure_max_defer', conf_file, conf)
+        _set_val('rsync_timeout', conf_file, conf)
+        _set_val('shutdown_timeout', conf_file, conf)
+        _set_val('metrics_file', conf_file, conf)
+        _set_val('metrics_interval', conf_file, conf)
+        _set_val('trace_file', conf_file, conf)
+        _set_val('profile_dir', conf_file, conf)
+        _set_val('profile_secs', conf_file, conf)
+        _set_val('event_trace_file', conf_file, conf)
 
         #
         # rsync_opts string -> list
@@ -124,10 +218,11 @@ def read_config(config_file) -> dict[str, Any]:
         #
         # sync is a list, where each element is a list:
         #   [source, dest] or [source, dest, excludes]
+        #   optionally followed by table of per item options
         # dest is a path string or list of paths
         # excludes is a list of strings.
         # Map to list of tuples:
-        #   (src: str, dst: list[stre], exclude: list[str])
+        #   (src: str, dst: list[stre], exclude: list[str], opts: dict)
         #
         val = conf_file.get('sync')
         if val is not None:
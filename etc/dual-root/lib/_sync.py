@@ -6,8 +6,16 @@
 """
 # pylint: disable=too-few-public-methods
 # pylint: disable=too-many-arguments, too-many-positional-arguments
+from typing import (Any)
 from .sync import (rsync_options_final, check_sync_list)
 from .class_inotify import Inotify
+from .class_scheduler import SyncScheduler
+from .prio import Prio
+from .cgroup import RsyncCgroups
+from .pressure import PressureGate
+from .metrics import MetricsWriter
+from .tracing import (start_tracing, stop_tracing)
+from .event_trace import event_recorder
 from ._syncitem_base import (RsyncItem)
 from ._syncitem import (SyncItem)
 from ._types import (SyncListElem)
@@ -29,9 +37,35 @@ class Sync:
             sync_list (List[src: str, dst: str or list[str], excl: list[str]]):
         """
         self.okay: bool = True
-        self.inotify: Inotify
+        self.inotify: Inotify | None = None
         # self.sync_list: list[SyncListElem] = sync_list
         self.sync_delay = conf.sync_delay
+        self.sync_max_latency = conf.sync_max_latency
+        self.inotify_backend = conf.inotify_backend
+        self.full_sync_interval = conf.full_sync_interval
+        self.rsync_batch = conf.rsync_batch
+        self.dest_workers = conf.dest_workers
+        self.shutdown_timeout: float | None = conf.shutdown_timeout
+        if self.shutdown_timeout <= 0:
+            self.shutdown_timeout = None
+        self.metrics_file = conf.metrics_file
+        self.metrics_interval = conf.metrics_interval
+        self.trace_file = conf.trace_file
+        self.profile_dir = conf.profile_dir
+        self.profile_secs = conf.profile_secs
+        self.event_trace_file = conf.event_trace_file
+        # cgroups (daemon only) - limits for each item by source
+        self.cgroups: RsyncCgroups | None = None
+        self.cgroup_limits: dict[str, dict[str, Any]] = {}
+
+        # runs all the syncs - deferred while system is busy
+        pressure = PressureGate({'io': conf.pressure_io,
+                                 'cpu': conf.pressure_cpu,
+                                 'memory': conf.pressure_memory})
+        self.scheduler = SyncScheduler(workers=conf.sync_threads,
+                                       quiet=conf.quiet,
+                                       pressure=pressure,
+                                       max_defer=conf.pressure_max_defer)
 
         #
         # check sync list
@@ -71,13 +105,55 @@ class Sync:
             if len(list_item) > 2:
                 excl = list_item[2]
 
+            opts: dict[str, Any] = {}
+            if len(list_item) > 3:
+                opts = list_item[3]
+
+            sync_delay = opts.get('sync_delay', self.sync_delay)
+            max_latency = opts.get('sync_max_latency', self.sync_max_latency)
+            prio = _item_prio(conf, opts)
+            if conf.cgroup and not test:
+                self.cgroup_limits[src] = _item_cgroup_limits(conf, opts)
+
             rsync_item = RsyncItem(src, dst, excl, self.rsync_opts)
-            sync_item = SyncItem(rsync_item, self.sync_delay,
-                                 quiet, test)
+            sync_item = SyncItem(
+                    rsync_item, sync_delay, quiet, test,
+                    full_interval=self.full_sync_interval,
+                    batch=self.rsync_batch,
+                    dest_workers=self.dest_workers,
+                    scheduler=self.scheduler,
+                    max_latency=max_latency,
+                    prio=prio,
+                    critical=opts.get('critical', False),
+                    rsync_timeout=opts.get('rsync_timeout',
+                                           conf.rsync_timeout),
+                    latency_slo=opts.get('sync_latency_slo',
+                                         conf.sync_latency_slo))
             sync_items.append(sync_item)
 
         return sync_items
 
+    def _init_cgroups(self):
+        """
+        Daemon: cgroup for rsync of each item (if using cgroups).
+         - a one off sync stays where it was started.
+        """
+        if not self.cgroup_limits:
+            return
+
+        if self.cgroups is None:
+            self.cgroups = RsyncCgroups()
+
+        for (num, item) in enumerate(self.sync_items, start=1):
+            limits = self.cgroup_limits.get(item.rsync_item.src)
+            if limits is None:
+                continue
+            dests = item.rsync_item.dst
+            if isinstance(dests, str):
+                dests = [dests]
+            item.cgroup = self.cgroups.item_cgroup(f'sync-{num}', dests,
+                                                   **limits)
+
     def add_sync_list_items(self, conf: Config, sync_list: list[SyncListElem]):
         """
         Adds sync_items from sync list items.
@@ -90,31 +166,79 @@ class Sync:
         sync all items
         """
         for item in self.sync_items:
-            item.sync_if_needed(force=True)
+            item.mark_full()
+            item.sync_pending(force=True)
+        self.scheduler.wait_idle()
 
     def sync_all_items_if_needed(self):
         """
         sync all items
         """
         for item in self.sync_items:
-            item.sync_if_needed()
+            item.sync_pending()
+        self.scheduler.wait_idle()
 
     def init_daemon(self):
         """
         Set up the daemon with inotify on all the items to be synced
         """
-        self.inotify = Inotify()
+        profiler = start_tracing(self.trace_file, self.profile_dir,
+                                 self.profile_secs)
+        self._init_cgroups()
+
+        inotify = Inotify(backend=self.inotify_backend)
+        inotify.recorder = event_recorder(self.event_trace_file)
+        self.inotify = inotify
         print('Sync Daemon: Adding items to watch list')
         for one_sync_item in self.sync_items:
             src = one_sync_item.rsync_item.src
             dst = one_sync_item.rsync_item.dst
             exc = one_sync_item.rsync_item.excl
             print(f'  ({src}, {dst}, {exc})')
-            self.inotify.add_watch_item(one_sync_item)
+            inotify.add_watch_item(one_sync_item)
+
+        inotify.popen_inotify()
+
+        metrics: MetricsWriter | None = None
+        if self.metrics_file:
+            metrics = MetricsWriter(self.metrics_file, self,
+                                    self.metrics_interval)
+            metrics.start()
 
-        self.inotify.popen_inotify()
         print('Monitoring')
-        self.inotify.event_handler()
+        inotify.event_handler()
 
         # Ensure any pending syncs are handled
-        self.sync_all_items_if_needed()
+        self.scheduler.shutdown(drain=True, timeout=self.shutdown_timeout)
+
+        if metrics is not None:
+            metrics.stop()
+
+        stop_tracing(profiler)
+        if inotify.recorder is not None:
+            inotify.recorder.close()
+
+
+def _item_cgroup_limits(conf: Config, opts: dict[str, Any]) -> dict[str, Any]:
+    """
+    cgroup limits for one item
+     - values not given for the item default to the global ones
+    """
+    return {'io_weight': opts.get('io_weight', conf.io_weight),
+            'io_max': opts.get('io_max', conf.io_max),
+            'cpu_weight': opts.get('cpu_weight', conf.cpu_weight)}
+
+
+def _item_prio(conf: Config, opts: dict[str, Any]) -> Prio | None:
+    """
+    Priority for rsync of one item.
+     - None if item has none of its own (rsync inherits daemon priority)
+     - values not given for the item default to the global ones
+    """
+    if not any(key in opts for key in ('nice', 'ionice_class',
+                                        'ionice_level')):
+        return None
+
+    return Prio(nice=opts.get('nice', conf.nice),
+                ionice_class=opts.get('ionice_class', conf.ionice_class),
+                ionice_level=opts.get('ionice_level', conf.ionice_level))
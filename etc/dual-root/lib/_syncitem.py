@@ -1,13 +1,10 @@
-# SPDX-License-Identifier: MIT
+# SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
 """
   Dual Root Support
   Simple class for handling sync (uses rsync)
 """
 # pylint: disable=too-few-public-methods
-import time
-import threading
-from .sync import sync_one
 from ._syncitem_base import (SyncItemBase)
 
 
@@ -16,58 +13,54 @@ class SyncItem(SyncItemBase):
     One item to be watched and synced
      - Holds: source, destination_list, exclusion list
      - standard rsync options are common and not per item
+     - syncs are run by the scheduler (see class_scheduler::SyncScheduler)
     """
+    def add_dirty(self, path: str, tree: bool = False):
+        """
+        Record path changed - synced on next sync().
+        """
+        self.dirty.add(path, tree)
+
+    def mark_full(self):
+        """
+        Next sync copies the whole tree (e.g. events were lost)
+        """
+        self.dirty.mark_full()
+
     def sync(self):
         """
         sync myself
+         - something changed: runs once no further changes for sync_delay
+           seconds, but no later than sync_max_latency after first change.
         """
-        now = time.time()
-        self.pending = True
-        if (now - self.last_sync) > self.sync_delay:
-            self.sync_one_thread(now=now)
+        self.scheduler.request(self)
 
     def sync_no_delay(self):
         """
         sync myself skip any delays
-         - play nice with threads
         """
-        self.pending = True
-        self.sync_one_thread()
+        self.scheduler.request(self, delay=0)
 
-    def sync_one_thread(self, now=None):
-        '''
-        Run in thread
-         - only run one at a time
-        '''
-        if not self.is_running():
-            if now is None:
-                now = time.time()
-            self.last_sync = now
-            self.pending = False
-            args = (self, self.quiet)
-            self.thread = threading.Thread(target=sync_one, args=args)
-            self.thread.start()
+    def is_running(self) -> bool:
+        ''' check if sync is running '''
+        return self.scheduler.is_running(self)
 
-    def is_running(self):
-        ''' check if have running sync thread '''
-        if self.thread and self.thread.is_alive():
-            return True
-        return False
+    def is_pending(self) -> bool:
+        ''' check if sync is waiting to run '''
+        return self.scheduler.is_pending(self)
 
     def sync_if_needed(self, force=False):
         '''
-        If have pending sync, then
-         wait loop (30 sec sleeps) until existing sync completes then run again
+        If have pending sync (or force) then sync now and wait
+        for it to complete.
         '''
-        if self.pending or force:
-            while self.is_running():
-                time.sleep(30)
-            self.sync_one_thread()
+        if self.is_pending() or force:
+            self.scheduler.request(self, delay=0)
+            self.scheduler.wait_idle(self)
 
     def sync_pending(self, force=False):
         '''
-        If have pending sync, then
-         wait loop (30 sec sleeps) until existing sync completes then run again
+        If have pending sync (or force) then sync now.
         '''
-        if self.pending or force:
-            self.sync_one_thread()
+        if self.is_pending() or force:
+            self.scheduler.request(self, delay=0)
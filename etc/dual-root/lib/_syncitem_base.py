@@ -5,7 +5,13 @@
   Simple class for handling sync (uses rsync)
 """
 # pylint: disable=too-few-public-methods
-import threading
+# pylint: disable=too-many-arguments
+from .sync_dirty import DirtyPaths
+from .class_scheduler import SyncScheduler
+from .prio import Prio
+from .cgroup import Cgroup
+from .rsync_stats import SyncHistory
+from .sync_latency import SyncLatency
 
 
 class RsyncItem:
@@ -49,13 +55,57 @@ class SyncItemBase:
                  rsync_item: RsyncItem,
                  delay: float,
                  quiet: bool,
-                 test: bool
+                 test: bool,
+                 *,
+                 full_interval: float = 86400,
+                 batch: bool = True,
+                 dest_workers: int = 4,
+                 scheduler: SyncScheduler | None = None,
+                 max_latency: float = 300,
+                 prio: Prio | None = None,
+                 cgroup: Cgroup | None = None,
+                 critical: bool = False,
+                 rsync_timeout: float = 0,
+                 latency_slo: float = 0
                  ):
         self.quiet = quiet
         self.test = test
+        self.batch = batch
+        self.dest_workers = dest_workers
 
         self.rsync_item: RsyncItem = rsync_item
+        # debounce: quiet period and longest wait after first change
         self.sync_delay: float = delay
-        self.last_sync: int = -1
-        self.pending: bool = False
-        self.thread: threading.Thread | None = None
+        self.sync_max_latency: float = max_latency
+        self.priority: int = 10
+
+        # critical items are never held off due to system pressure
+        self.critical: bool = critical
+
+        # longest each rsync may run (0 = no limit)
+        self.rsync_timeout: float = rsync_timeout
+
+        # nice/ionice for rsync (None = same as daemon)
+        self.prio: Prio | None = prio
+
+        # cgroup for rsync (None = same as daemon) and its
+        # usage/throttling during last sync (see cgroup::Cgroup.stats())
+        self.cgroup: Cgroup | None = cgroup
+        self.cgroup_stats: dict[str, int] = {}
+
+        # runs our syncs - shared by all items
+        if scheduler is None:
+            scheduler = SyncScheduler(quiet=quiet)
+        self.scheduler: SyncScheduler = scheduler
+
+        # what changed since last sync
+        self.dirty: DirtyPaths = DirtyPaths(full_interval)
+
+        # seconds each destination took on last sync
+        self.dest_times: dict[str, float] = {}
+
+        # what recent rsyncs did (files, bytes, times)
+        self.history: SyncHistory = SyncHistory()
+
+        # first unsynced change event to replica updated (see scheduler)
+        self.latency: SyncLatency = SyncLatency(latency_slo)
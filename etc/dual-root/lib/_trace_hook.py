@@ -0,0 +1,49 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Tracing hook for code also used on the boot path (run_prog).
+
+Imports nothing, so tracing (and json, cProfile ...) is only loaded
+by the sync daemon. tracing::start_tracing() installs its trace_span()
+here when a trace file is in use.
+"""
+# pylint: disable=global-statement
+from typing import (Any)
+from collections.abc import (Callable)
+
+
+class NullSpan:
+    """
+    Span when tracing is off.
+    """
+    def set(self, **attrs):
+        """ ignored """
+
+    def __enter__(self) -> 'NullSpan':
+        return self
+
+    def __exit__(self, _exc_type, _exc_val, _exc_tb) -> None:
+        return None
+
+
+NULL_SPAN = NullSpan()
+
+_SPAN_FUNC: Callable[..., Any] | None = None
+
+
+def set_span_func(func: Callable[..., Any] | None):
+    """
+    Install (None removes) the function making spans.
+    """
+    global _SPAN_FUNC
+    _SPAN_FUNC = func
+
+
+def trace_span(name: str, **attrs) -> Any:
+    """
+    Span from tracing::trace_span() if tracing, else NULL_SPAN.
+    """
+    func = _SPAN_FUNC
+    if func is None:
+        return NULL_SPAN
+    return func(name, **attrs)
@@ -3,4 +3,6 @@
 """
 Convenience Types
 """
-type SyncListElem = tuple[str, list[str], list[str]]
+from typing import (Any)
+
+type SyncListElem = tuple[str, list[str], list[str], dict[str, Any]]
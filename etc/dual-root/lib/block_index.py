@@ -0,0 +1,220 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - block device and mount index.
+
+One snapshot of which block device is mounted where, together with
+the UUID and PARTUUID of each device. Built once from:
+ - /proc/self/mountinfo
+ - /dev/disk/by-uuid and /dev/disk/by-partuuid
+
+If those are not available, a single "lsblk -J" is used instead.
+
+All lookups are then simple dictionary lookups.
+Use block_index() to get the (shared) index.
+"""
+# pylint: disable=too-many-instance-attributes, global-statement
+# pylint: disable=import-outside-toplevel
+import os
+import re
+import threading
+
+from .utils import (run_cmd, tool_path)
+
+_MOUNTINFO = '/proc/self/mountinfo'
+_BY_UUID = '/dev/disk/by-uuid'
+_BY_PARTUUID = '/dev/disk/by-partuuid'
+
+
+class BlockIndex:
+    """
+    Snapshot of block devices, their ids and mount points.
+
+    Devices are identified by their path, e.g. '/dev/nvme0n1p1'.
+
+    Args:
+        use_lsblk (bool):
+            Read devices with lsblk even if /dev/disk and
+            mountinfo are available.
+    """
+    def __init__(self, use_lsblk: bool = False):
+        self.dev_uuid: dict[str, str] = {}
+        self.uuid_dev: dict[str, str] = {}
+        self.dev_partuuid: dict[str, str] = {}
+        self.partuuid_dev: dict[str, str] = {}
+
+        # mount point -> device and device -> mount points
+        self.mount_dev: dict[str, str] = {}
+        self.dev_mounts: dict[str, list[str]] = {}
+
+        # "major:minor" -> device
+        self.majmin_dev: dict[str, str] = {}
+
+        if (not use_lsblk and os.path.isdir(_BY_UUID)
+                and os.path.exists(_MOUNTINFO)):
+            self._read_by_id(_BY_UUID, self.dev_uuid, self.uuid_dev)
+            self._read_by_id(_BY_PARTUUID, self.dev_partuuid,
+                             self.partuuid_dev)
+            self._read_mountinfo()
+        else:
+            self._read_lsblk()
+
+    def _add_mount(self, dev: str, mount: str):
+        """ record dev mounted on mount """
+        self.mount_dev[mount] = dev
+        mounts = self.dev_mounts.setdefault(dev, [])
+        if mount not in mounts:
+            mounts.append(mount)
+
+    def _read_by_id(self, by_dir: str,
+                    dev_id: dict[str, str], id_dev: dict[str, str]):
+        """
+        Read one of /dev/disk/by-xxx
+        """
+        try:
+            names = os.listdir(by_dir)
+        except OSError:
+            return
+
+        for name in names:
+            dev = os.path.realpath(os.path.join(by_dir, name))
+            dev_id[dev] = name
+            id_dev[name] = dev
+            try:
+                rdev = os.stat(dev).st_rdev
+                self.majmin_dev[f'{os.major(rdev)}:{os.minor(rdev)}'] = dev
+            except OSError:
+                pass
+
+    def _read_mountinfo(self):
+        """
+        Parse /proc/self/mountinfo:
+          id parent maj:min root mount_point opts [optional ...]
+          - fstype source super_opts
+        """
+        try:
+            with open(_MOUNTINFO, 'r', encoding='utf-8') as fobj:
+                lines = fobj.readlines()
+        except OSError as err:
+            print(f'Error reading {_MOUNTINFO}: {err}')
+            return
+
+        for line in lines:
+            fields = line.split()
+            if len(fields) < 10 or '-' not in fields:
+                continue
+
+            sep = fields.index('-', 6)
+            majmin = fields[2]
+            mount = _unescape(fields[4])
+            source = _unescape(fields[sep + 2])
+
+            dev = ''
+            if source.startswith('/dev/'):
+                dev = os.path.realpath(source)
+            if not dev:
+                dev = self.majmin_dev.get(majmin, '')
+            if dev:
+                self._add_mount(dev, mount)
+
+    def _read_lsblk(self):
+        """
+        Fallback - one lsblk call.
+        """
+        import json
+
+        pargs = [tool_path('lsblk'), '-J', '-o', 'PATH,UUID,PARTUUID,MOUNTPOINTS']
+        lines = run_cmd(pargs)
+        if not lines:
+            print('Failed to read block devices using lsblk')
+            return
+
+        try:
+            data = json.loads('\n'.join(lines))
+        except json.JSONDecodeError as err:
+            print(f'Failed to parse lsblk output: {err}')
+            return
+
+        todo = list(data.get('blockdevices', []))
+        while todo:
+            bdev = todo.pop()
+            todo += bdev.get('children', [])
+
+            dev = bdev.get('path')
+            if not dev:
+                continue
+            uuid = bdev.get('uuid')
+            if uuid:
+                self.dev_uuid[dev] = uuid
+                self.uuid_dev[uuid] = dev
+            partuuid = bdev.get('partuuid')
+            if partuuid:
+                self.dev_partuuid[dev] = partuuid
+                self.partuuid_dev[partuuid] = dev
+            for mount in bdev.get('mountpoints') or []:
+                if mount:
+                    self._add_mount(dev, mount)
+
+    def device_of_partuuid(self, partuuid: str) -> str:
+        """ device with partuuid (or '') """
+        return self.partuuid_dev.get(partuuid.lower(), '')
+
+    def device_of_uuid(self, uuid: str) -> str:
+        """ device with uuid (or '') """
+        return self.uuid_dev.get(uuid, '')
+
+    def device_of_mount(self, mount: str) -> str:
+        """ device mounted on mount point (or '') """
+        return self.mount_dev.get(_norm_mount(mount), '')
+
+    def uuid_of_device(self, dev: str) -> str:
+        """ uuid of device (or '') """
+        return self.dev_uuid.get(dev, '')
+
+    def uuid_of_mount(self, mount: str) -> str:
+        """ uuid of device mounted on mount point (or '') """
+        return self.dev_uuid.get(self.device_of_mount(mount), '')
+
+    def mounts_of_device(self, dev: str) -> list[str]:
+        """ all mount points of device """
+        return list(self.dev_mounts.get(dev, []))
+
+    def is_mounted(self, mount: str) -> bool:
+        """ True if some block device is mounted on mount """
+        return _norm_mount(mount) in self.mount_dev
+
+
+def _norm_mount(mount: str) -> str:
+    """ mount point without trailing '/' """
+    if len(mount) > 1:
+        mount = mount.rstrip('/')
+    return mount
+
+
+def _unescape(field: str) -> str:
+    """
+    mountinfo escapes space, tab, newline and backslash as octal (e.g. \\040)
+    """
+    if '\\' not in field:
+        return field
+    return re.sub(r'\\([0-7]{3})', lambda mat: chr(int(mat.group(1), 8)),
+                  field)
+
+
+_INDEX: BlockIndex | None = None
+_INDEX_LOCK = threading.Lock()
+
+
+def block_index(refresh: bool = False) -> BlockIndex:
+    """
+    The shared block index.
+
+    Args:
+        refresh (bool):
+            Rebuild it (e.g. after mounting something).
+    """
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None or refresh:
+            _INDEX = BlockIndex()
+        return _INDEX
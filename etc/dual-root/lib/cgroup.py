@@ -0,0 +1,247 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - cgroup v2 limits for rsync.
+
+ionice is ignored by some io schedulers (mq-deadline, none),
+cgroup io controls are not. Each sync item can get its own cgroup,
+created under the daemon's own cgroup, and each rsync of that item
+is started by a shell which joins it and then execs rsync, so rsync
+and everything it forks is in it from the start.
+Only used by the sync daemon.
+
+Layout (under the daemon's cgroup, e.g. dual-root-syncd.service):
+    daemon/       - the daemon itself (leaf)
+    sync-<n>/     - rsync processes of sync item n
+
+cgroup v2 only allows controllers to be enabled for children
+if the parent has no processes itself, hence the daemon leaf.
+Under systemd the service should have Delegate=yes.
+No systemd dependency otherwise.
+"""
+import os
+import shlex
+
+from .utils_block import path_to_disks
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+_CONTROLLERS = ('io', 'cpu')
+
+
+class Cgroup:
+    """
+    One cgroup v2 directory.
+    """
+    def __init__(self, path: str):
+        self.path: str = path
+        self._procs: str = os.path.join(path, 'cgroup.procs')
+
+    def write(self, name: str, value: str) -> bool:
+        """
+        Write value to cgroup file.
+        """
+        try:
+            with open(os.path.join(self.path, name), 'w',
+                      encoding='utf-8') as fobj:
+                fobj.write(value)
+        except OSError as err:
+            print(f'cgroup: {self.path}/{name} = {value} failed: {err}')
+            return False
+        return True
+
+    def read(self, name: str) -> str:
+        """
+        Content of cgroup file ('' if not available).
+        """
+        try:
+            with open(os.path.join(self.path, name), 'r',
+                      encoding='utf-8') as fobj:
+                return fobj.read()
+        except OSError:
+            return ''
+
+    def add_pid(self, pid: int) -> bool:
+        """
+        Move process pid into this cgroup.
+        """
+        return self.write('cgroup.procs', str(pid))
+
+    def exec_in(self, pargs: list[str]) -> list[str]:
+        """
+        Command running pargs in this cgroup.
+         - /bin/sh moves itself into the cgroup then execs pargs.
+           Should that fail, pargs still runs (in the daemon's cgroup).
+        """
+        join = f'{{ echo $$ > {shlex.quote(self._procs)}; }} 2>/dev/null'
+        return ['/bin/sh', '-c', f'{join}; exec "$@"', 'sh'] + pargs
+
+    def stats(self) -> dict[str, int]:
+        """
+        Cumulative usage and throttling.
+
+        Returns:
+            dict[str, int]:
+              - cpu_usec          : cpu used
+              - cpu_throttled_usec: time held back by cpu.max
+              - io_stall_usec     : time some task waited on io (io.pressure)
+              - io_rbytes, io_wbytes : bytes read/written (all devices)
+        """
+        stats = {'cpu_usec': 0, 'cpu_throttled_usec': 0, 'io_stall_usec': 0,
+                 'io_rbytes': 0, 'io_wbytes': 0}
+
+        for line in self.read('cpu.stat').splitlines():
+            (key, _sep, val) = line.partition(' ')
+            if key == 'usage_usec':
+                stats['cpu_usec'] = int(val)
+            elif key == 'throttled_usec':
+                stats['cpu_throttled_usec'] = int(val)
+
+        for line in self.read('io.pressure').splitlines():
+            if line.startswith('some '):
+                total = line.rsplit('total=', 1)[-1]
+                if total.isdigit():
+                    stats['io_stall_usec'] = int(total)
+
+        for line in self.read('io.stat').splitlines():
+            for field in line.split()[1:]:
+                (key, _sep, val) = field.partition('=')
+                if key in ('rbytes', 'wbytes') and val.isdigit():
+                    stats[f'io_{key}'] += int(val)
+
+        return stats
+
+
+def own_cgroup() -> str:
+    """
+    Path of our cgroup v2 directory ('' if not using cgroup v2).
+    """
+    if not os.path.exists(os.path.join(CGROUP_ROOT, 'cgroup.controllers')):
+        return ''
+
+    try:
+        with open('/proc/self/cgroup', 'r', encoding='utf-8') as fobj:
+            lines = fobj.readlines()
+    except OSError:
+        return ''
+
+    for line in lines:
+        if line.startswith('0::'):
+            rel = line[3:].strip().lstrip('/')
+            return os.path.join(CGROUP_ROOT, rel)
+    return ''
+
+
+def disk_majmin(disk: str) -> str:
+    """
+    "major:minor" of a disk name (e.g. nvme0n1).
+     - io.max limits are set on whole disks.
+    """
+    if ':' in disk:
+        return disk
+    try:
+        with open(f'/sys/block/{disk}/dev', 'r', encoding='utf-8') as fobj:
+            return fobj.read().strip()
+    except OSError:
+        return ''
+
+
+class RsyncCgroups:
+    """
+    Creates and holds cgroups for rsync of each sync item.
+    """
+    def __init__(self):
+        self.okay: bool = False
+        self.base: Cgroup | None = None
+        self.controllers: list[str] = []
+        self._setup()
+
+    def _setup(self):
+        """
+        Move ourselves into a leaf and enable io/cpu controllers
+        for children.
+        """
+        path = own_cgroup()
+        if not path:
+            print('cgroup: cgroup v2 not available - limits not used')
+            return
+
+        base = Cgroup(path)
+        if os.path.basename(path) == 'daemon':
+            # restarted in process - already in our leaf
+            base = Cgroup(os.path.dirname(path))
+
+        avail = base.read('cgroup.controllers').split()
+        self.controllers = [ctl for ctl in _CONTROLLERS if ctl in avail]
+
+        leaf = Cgroup(os.path.join(base.path, 'daemon'))
+        try:
+            os.makedirs(leaf.path, exist_ok=True)
+        except OSError as err:
+            print(f'cgroup: cannot create {leaf.path}: {err}')
+            return
+
+        if not leaf.add_pid(os.getpid()):
+            return
+
+        if self.controllers:
+            enable = ' '.join(f'+{ctl}' for ctl in self.controllers)
+            if not base.write('cgroup.subtree_control', enable):
+                print(f'cgroup: {base.path} has other processes?')
+                return
+
+        self.base = base
+        self.okay = True
+
+    def item_cgroup(self, name: str, dests: list[str],
+                    io_weight: int = 0,
+                    io_max: str = '',
+                    cpu_weight: int = 0) -> Cgroup | None:
+        """
+        Create (or reuse) cgroup for one sync item.
+
+        Args:
+            name (str):
+                cgroup name.
+
+            dests (list[str]):
+                Destinations - io_max applies to their disks.
+
+            io_weight (int):
+                1-10000 (default 100). 0 leaves unchanged.
+
+            io_max (str):
+                Limits for io.max, e.g. "wbps=50000000 wiops=2000".
+
+            cpu_weight (int):
+                1-10000 (default 100). 0 leaves unchanged.
+
+        Returns:
+            Cgroup | None:
+            None if cgroups not available.
+        """
+        if not self.okay or self.base is None:
+            return None
+
+        cgroup = Cgroup(os.path.join(self.base.path, name))
+        try:
+            os.makedirs(cgroup.path, exist_ok=True)
+        except OSError as err:
+            print(f'cgroup: cannot create {cgroup.path}: {err}')
+            return None
+
+        if io_weight > 0 and 'io' in self.controllers:
+            cgroup.write('io.weight', f'default {io_weight}')
+
+        if io_max and 'io' in self.controllers:
+            disks: set[str] = set()
+            for dest in dests:
+                disks |= set(path_to_disks(dest))
+            for disk in sorted(disks):
+                majmin = disk_majmin(disk)
+                if majmin:
+                    cgroup.write('io.max', f'{majmin} {io_max}')
+
+        if cpu_weight > 0 and 'cpu' in self.controllers:
+            cgroup.write('cpu.weight', str(cpu_weight))
+
+        return cgroup
@@ -21,7 +21,8 @@ But for now this works.
 
  GC 2023
 """
-# pylint: disable=too-few-public-methods
+# pylint: disable=too-few-public-methods, import-outside-toplevel
+from typing import (TYPE_CHECKING)
 import os
 from .utils import os_scandir
 from .utils_block import device_to_uuid_mounts
@@ -30,8 +31,9 @@ from .utils_block import partuuid_to_device
 from .utils_block import mount_to_uuid
 from .utils_block import bind_mount
 from .config import Config
-from ._sync import Sync
-from .prio import Prio
+
+if TYPE_CHECKING:
+    from ._sync import Sync
 
 
 class Esp:
@@ -90,15 +92,18 @@ class EspInfo():
 
     Provide bind mounting current <esp> onto efi_mount (/boot)
     Provide rsync of current to alternate esp.
+
+    When only bind mounting (boot time), none of the sync
+    setup is done and the sync code is not even imported.
     """
     # pylint: disable=too-many-instance-attributes
-    def __init__(self):
+    def __init__(self, conf: Config | None = None):
         #
         # esp is the currently booted esp.
         # Alternate esp's are listed in esp_alt
         #
         self.okay = True
-        self.conf = Config()
+        self.conf = conf if conf is not None else Config()
 
         self.esp: Esp = Esp()
         self.esp_alt: list[Esp] = []
@@ -113,13 +118,21 @@ class EspInfo():
 
         conf = self.conf
         self.sync_dual_root: bool = conf.dualroot
+        self.sync: Sync | None = None
+
+        self.efi_mount_uuid = mount_to_uuid(conf.efi_mount)
+        self.is_efi_mounted()
+
+        if conf.bind_only:
+            return
+
+        from .prio import Prio
+        from ._sync import Sync
 
         prio = Prio(nice=conf.nice, ionice_class=conf.ionice_class,
                     ionice_level=conf.ionice_level)
         prio.set_prio()
 
-        self.efi_mount_uuid = mount_to_uuid(conf.efi_mount)
-        self.is_efi_mounted()
         self.dual_root_mounts()
 
         #
@@ -222,7 +235,7 @@ class EspInfo():
           - source is currently booted efi mount
           - dest is list of alternates
         """
-        if not self.sync_dual_root:
+        if not self.sync_dual_root or self.sync is None:
             return
 
         current_efi = self.esp.mount
@@ -252,14 +265,16 @@ class EspInfo():
             dest_list.append(f'{dest}/')
 
         exclusions: list[str] = []
-        sync_item = (f'{current_efi}/', dest_list, exclusions)
+        opts = {'critical': True}
+        sync_item = (f'{current_efi}/', dest_list, exclusions, opts)
         self.sync.add_sync_list_items(self.conf, [sync_item])
 
     def sync_all_items(self):
         """
         One shot sync - no daemon
         """
-        self.sync.sync_all_items()
+        if self.sync is not None:
+            self.sync.sync_all_items()
 
     def sync_daemon_start(self):
         """
@@ -267,4 +282,5 @@ class EspInfo():
          - Use inotify to monitor current efi and sync
            alternates whenever change detected
         """
-        self.sync.init_daemon()
+        if self.sync is not None:
+            self.sync.init_daemon()
@@ -6,30 +6,68 @@
 # pylint: disable=global-statement
 from types import FrameType
 import atexit
-from select import select
+import os
+from select import (epoll, EPOLLIN)
 from subprocess import Popen
 
 from .inotify_tools import (catch_signals, terminate_one_inotify)
-from .inotify_tools import popen_one_inotify
+from .inotify_tools import (popen_one_inotify, parse_event_line)
+from .inotify_native import (InotifyNative, InotifyEvent)
+from .inotify_native import (IN_Q_OVERFLOW, IN_UNMOUNT)
+from .tracing import trace_span
+from .event_trace import EventRecorder
+from .rsync_filter import RsyncFilter
 
 from ._syncitem import SyncItem
 
+BACKEND_NATIVE = 'native'
+BACKEND_INOTIFYWAIT = 'inotifywait'
+
+# bytes read from an inotifywait pipe at a time
+_PIPE_READ_SIZE = 65536
+
 
 class WatchItem:
     """ one watched directory """
-    def __init__(self, sync_item: SyncItem):
+    def __init__(self, sync_item: SyncItem,
+                 native: InotifyNative | None = None):
         """
         One inotify item
          - On event the action taken is calling: self.sync_item.sync()
+         - native is the shared in process inotify (native backend)
+           otherwise an inotifywait process is used.
         """
         self.sync_item: SyncItem = sync_item
         self.pipe: Popen | None = None
         self.pid: int = -1
 
+        self.native: InotifyNative | None = native
+        self.active: bool = False
+
+        # inotifywait output not yet a complete line
+        self.partial: bytearray = bytearray()
+
+        # events seen, dropped as excluded and times events were lost
+        self.num_events: int = 0
+        self.num_excluded: int = 0
+        self.num_overflows: int = 0
+
+        src = sync_item.rsync_item.src
+        self.root: str = src.rstrip('/') if len(src) > 1 else src
+
+        # paths rsync never copies - not watched and changes ignored
+        self.excl: RsyncFilter = RsyncFilter(src, sync_item.rsync_item.excl)
+
     def terminate(self):
         """
         Ensure child inotify process is temrminated
         """
+        if self.native is not None:
+            if self.active:
+                self.native.remove_tree(self.sync_item.rsync_item.src)
+            self.active = False
+            return
+
         if self.pipe is not None:
             terminate_one_inotify(self.pipe, self.pid)
         self.pipe = None
@@ -38,12 +76,24 @@ class WatchItem:
     def popen_inotify(self):
         """
         Open up pipe to inotify process
+         - native backend: add recursive watches instead.
         """
         watched = self.sync_item.rsync_item.src
-        self.pipe = popen_one_inotify(watched)
+
+        if self.native is not None:
+            num = self.native.add_tree(watched, self, self.excl.excluded_dir)
+            self.active = num > 0
+            if self.active:
+                print(f'Watching {watched} ({num} directories)')
+            else:
+                print(f'Warning: inotify on {watched} failed')
+            return
+
+        self.pipe = popen_one_inotify(watched, self.excl.inotifywait_regex())
 
         if self.pipe:
             self.pid = self.pipe.pid
+            self.active = True
         else:
             print(f'Warning: inotify on {watched} failed')
 
@@ -56,7 +106,38 @@ def inotify_signal_handler(_sig_num: int, _sig_frame: FrameType | None):
     Clean up
     """
     for item in WatchList:
-        item.terminate()
+        if item.native is None:
+            item.terminate()
+
+    # native event loop cleans up once woken
+    if _Wakeup is not None:
+        _Wakeup.wake()
+
+
+class _WakeupPipe:
+    """
+    Self pipe used to wake up the native event loop (e.g. from signal handler)
+    """
+    def __init__(self):
+        (self.rfd, self.wfd) = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    def wake(self):
+        """ wake up anyone waiting """
+        try:
+            os.write(self.wfd, b'x')
+        except OSError:
+            pass
+
+    def close(self):
+        """ all done """
+        for fd in (self.rfd, self.wfd):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+
+_Wakeup: _WakeupPipe | None = None
 
 
 class Inotify:
@@ -66,20 +147,43 @@ class Inotify:
      - popen_inotify() to open one pipe to each monitor
      - event_handler()
 
-    For simplicity we use "/usr/bin/inotifywait".
+    Backends:
+     - native : one in process inotify instance for all watches (default).
+     - inotifywait : one "/usr/bin/inotifywait" process per watch item.
     """
-    def __init__(self):
+    def __init__(self, backend: str = BACKEND_NATIVE):
         """
         Add all the watch points then init()
-         - Map each items pipe.stdout -> item, when selec() can recover item.
+         - Map each items pipe.stdout -> item, so epoll can recover item.
 
          stdout_map maps(pipe.stdout -> watch item)
         """
-        global WatchList
+        global WatchList, _Wakeup
         self.watch_list: list[WatchItem] = []
         self.stdout_map: dict[int, WatchItem] = {}
 
+        self.backend: str = backend
+        self.native: InotifyNative | None = None
+        self.wakeup: _WakeupPipe | None = None
+
+        # records events handled (see event_trace)
+        self.recorder: EventRecorder | None = None
+
+        if backend == BACKEND_NATIVE:
+            try:
+                self.native = InotifyNative()
+                self.wakeup = _WakeupPipe()
+            except OSError as err:
+                print(f'Native inotify unavailable ({err}) - using inotifywait')
+                self.native = None
+                self.backend = BACKEND_INOTIFYWAIT
+
+        elif backend != BACKEND_INOTIFYWAIT:
+            print(f'Unknown inotify backend {backend} - using inotifywait')
+            self.backend = BACKEND_INOTIFYWAIT
+
         WatchList = self.watch_list
+        _Wakeup = self.wakeup
         catch_signals(inotify_signal_handler)
         atexit.register(self.terminate)
 
@@ -88,7 +192,7 @@ class Inotify:
         Add this to the watch list
          - make sure no existing match or reverse match.
         """
-        watch = WatchItem(sync_item)
+        watch = WatchItem(sync_item, self.native)
         self.watch_list.append(watch)
 
     def terminate(self):
@@ -98,12 +202,19 @@ class Inotify:
         for item in self.watch_list:
             item.terminate()
 
+        if self.native is not None:
+            self.native.close()
+        if self.wakeup is not None:
+            self.wakeup.wake()
+
     def popen_inotify(self):
         """
         Open pipes to each inotify item
         """
         for item in self.watch_list:
             item.popen_inotify()
+            if self.native is not None:
+                continue
             if item.pipe and item.pipe.stdout:
                 map_key = item.pipe.stdout.fileno()
                 self.stdout_map[map_key] = item
@@ -112,77 +223,270 @@ class Inotify:
         """
         Wait and handle any events
         """
-        _inotify_event_handler(self)
+        if self.native is not None:
+            _native_event_handler(self)
+        else:
+            _inotify_event_handler(self)
 
 
 def _inotify_event_handler(inotify: Inotify):
     """
-    Monitors all inotify pipes and handles events on any of them.
-     - on each event notify, run the correponding item's sync() function
-     - Use pipe.stdout map to find associated sync_item from the file IO
-       returned by select()
+    Monitors all inotifywait pipes and handles events on any of them.
+     - each pipe is registered once with epoll
+     - each wakeup drains everything buffered in the ready pipes
+       (non-blocking bulk reads) and splits it into lines
+     - changes are recorded line by line, but each item's sync()
+       is called once per wakeup
+     - pipe closed (inotifywait exited or terminated) or source
+       unmounted: watch is dropped.
     """
-    # pylint: disable=too-many-branches
     # pylint: disable=too-many-locals
+    recorder = inotify.recorder
+    fd_watch: dict[int, WatchItem] = {}
+
+    ep = epoll()
+    try:
+        for (fd, watch) in inotify.stdout_map.items():
+            if watch.pipe is None:
+                continue
+            os.set_blocking(fd, False)
+            ep.register(fd, EPOLLIN)
+            fd_watch[fd] = watch
+
+        if not fd_watch:
+            print('Nothing to watch - event_handler quitting')
+            return
+
+        # Pending syncs are run by the scheduler when due,
+        # so just wait for events.
+        while fd_watch:
+            ready = ep.poll()
+
+            changed: list[WatchItem] = []
+            for (fd, _ev) in ready:
+                ready_watch = fd_watch.get(fd)
+                if ready_watch is None:
+                    continue
+
+                with trace_span('event_read', backend='inotifywait') as span:
+                    (lines, eof) = _drain_pipe(fd, ready_watch)
+                    span.set(events=len(lines))
+
+                with trace_span('event_dispatch', src=ready_watch.root,
+                                events=len(lines)):
+                    (dirty, unmounted) = _dispatch_lines(ready_watch,
+                                                         lines, recorder)
+
+                if dirty and ready_watch not in changed:
+                    changed.append(ready_watch)
+
+                if eof or unmounted:
+                    ep.unregister(fd)
+                    del fd_watch[fd]
+                    ready_watch.terminate()
+
+            #
+            # Something changed - so lets sync.
+            #
+            for watch in changed:
+                watch.sync_item.sync()
+
+            if recorder is not None:
+                recorder.flush()
+
+    except OSError as err:
+        print(f'epoll err: {err}')
+        inotify.terminate()
+
+    finally:
+        ep.close()
+
+
+def _drain_pipe(fd: int, watch: WatchItem) -> tuple[list[str], bool]:
+    """
+    Read all that is available from non-blocking pipe.
+     - any partial last line is kept for next time
+
+    Returns:
+        tuple[lines: list[str], eof: bool]:
+        Complete lines read and True if pipe is closed.
+    """
+    buf = watch.partial
+    eof = False
+    while True:
+        try:
+            chunk = os.read(fd, _PIPE_READ_SIZE)
+        except BlockingIOError:
+            break
+        if not chunk:
+            eof = True
+            break
+        buf += chunk
+
+    if eof and buf and not buf.endswith(b'\n'):
+        buf += b'\n'
+
+    end = buf.rfind(b'\n')
+    if end < 0:
+        return ([], eof)
+
+    lines = buf[:end].decode('utf-8', 'surrogateescape').split('\n')
+    del buf[:end + 1]
+    return (lines, eof)
+
+
+def _dispatch_lines(watch: WatchItem, lines: list[str],
+                    recorder: EventRecorder | None) -> tuple[bool, bool]:
+    """
+    inotifywait events for watch.
+
+    Returns:
+        tuple[dirty: bool, unmounted: bool]:
+        dirty is True if anything changed (sync needed).
+    """
+    sync_item = watch.sync_item
+    dirty = False
+    for line in lines:
+        (events, path) = parse_event_line(line)
+        if not events:
+            continue
+
+        if 'UNMOUNT' in events:
+            txt = 'unmounted - terminating'
+            print(f'Watch dir {sync_item.rsync_item.src} {txt}')
+            return (dirty, True)
+
+        if path and watch.excl.excluded(path, 'ISDIR' in events):
+            watch.num_excluded += 1
+            continue
+
+        if recorder is not None:
+            src = '' if 'Q_OVERFLOW' in events else sync_item.rsync_item.src
+            recorder.record(src, events, path)
+
+        watch.num_events += 1
+        if 'Q_OVERFLOW' in events or not path:
+            if 'Q_OVERFLOW' in events:
+                watch.num_overflows += 1
+            sync_item.mark_full()
+        else:
+            tree = bool({'ISDIR', 'DELETE_SELF', 'MOVE_SELF'} & set(events))
+            sync_item.add_dirty(path, tree)
+        dirty = True
+
+    return (dirty, False)
+
+
+def _native_event_handler(inotify: Inotify):
+    """
+    Event loop for native backend.
+     - one inotify fd (plus wakeup pipe) registered with epoll
+     - each wakeup reads every queued event in one go and
+       calls sync() once for each watch item that saw any change.
+    """
+    # pylint: disable=too-many-branches
+    native = inotify.native
+    wakeup = inotify.wakeup
     watch_list = inotify.watch_list
-    num_items = len(watch_list)
 
-    if num_items < 1:
+    if native is None or wakeup is None:
+        return
+
+    if not any(item.active for item in watch_list):
         print('Nothing to watch - event_handler quitting')
         return
 
-    okay = True
-    num_active = num_items
-
-    while okay and num_active > 0:
-        #
-        # Check which items are still active
-        #
-        read_list = []
-        for item in watch_list:
-            if item.pipe:
-                if item.pipe.poll() is None:
-                    read_list.append(item.pipe.stdout)
-                else:
-                    item.terminate()
-
-        num_active = len(read_list)
-        if num_active < 1:
-            break
+    ep = epoll()
+    try:
+        ep.register(native.fileno(), EPOLLIN)
+        ep.register(wakeup.rfd, EPOLLIN)
 
-        # Since rsync is run in own thread - there can be pending
-        # items in queue;  so we periodically (every 15 mins) request
-        # any pending sync get run
-        timeout = 15*60
-        try:
-            (rdlist, _write, _err) = select(read_list, [], [], timeout)
-
-            if not rdlist:
-                # on timeout sync any pending items
-                for item in watch_list:
-                    item.sync_item.sync_pending()
-
-            for stdout in rdlist:
-                map_index = stdout.fileno()
-                watch = inotify.stdout_map[map_index]
-                event_line = stdout.readline()
-
-                if 'unmount' in event_line:
-                    txt = 'unmounted - terminating'
-                    print(f'Watch dir {watch.sync_item.rsync_item.src} {txt}')
-                    if watch.pipe is not None:
-                        watch.pipe.terminate()
-                    break
-
-                #
-                # Something changed - so lets sync.
-                #
-                watch.sync_item.sync()
+        while any(item.active for item in watch_list):
+            ready = ep.poll()
+            if not ready:
+                continue
 
-        except OSError as err:
-            print(f'Select err: {err}')
-            okay = False
-            break
+            if any(fd == wakeup.rfd for (fd, _ev) in ready):
+                # signal / terminate
+                break
 
-    if not okay:
-        inotify.terminate()
+            with trace_span('event_read', backend='native') as span:
+                events = native.read_events()
+                span.set(events=len(events))
+
+            with trace_span('event_dispatch', events=len(events)):
+                _dispatch_native(events, watch_list, inotify.recorder)
+            if inotify.recorder is not None:
+                inotify.recorder.flush()
+
+    except OSError as err:
+        print(f'epoll err: {err}')
+
+    finally:
+        ep.close()
+
+    inotify.terminate()
+
+
+def _dispatch_native(events: list[InotifyEvent], watch_list: list[WatchItem],
+                     recorder: EventRecorder | None):
+    """
+    Native events from one read: record changes then
+    call sync() once for each watch item that saw any.
+    """
+    changed: list[WatchItem] = []
+    for event in events:
+        watch = event.owner
+        if watch is not None and watch.excl.excluded(event.path,
+                                                     event.is_dir()):
+            watch.num_excluded += 1
+            continue
+
+        if recorder is not None:
+            _record_native(recorder, event)
+
+        if event.mask & IN_Q_OVERFLOW:
+            # lost events - sync everything
+            changed = [item for item in watch_list if item.active]
+            for watch in changed:
+                watch.num_overflows += 1
+                watch.sync_item.mark_full()
+            continue
+
+        if watch is None or not watch.active:
+            continue
+
+        if event.mask & IN_UNMOUNT:
+            src = watch.sync_item.rsync_item.src
+            print(f'Watch dir {src} unmounted - terminating')
+            watch.terminate()
+            continue
+
+        watch.num_events += 1
+        if event.path == watch.root and event.is_tree():
+            watch.sync_item.mark_full()
+        else:
+            watch.sync_item.add_dirty(event.path, event.is_tree())
+
+        if watch not in changed:
+            changed.append(watch)
+
+    #
+    # Something changed - so lets sync.
+    #
+    for watch in changed:
+        if watch.active:
+            watch.sync_item.sync()
+
+
+def _record_native(recorder: EventRecorder, event: InotifyEvent):
+    """
+    Add native event to event trace - if it is one we act on
+    """
+    src = ''
+    if not event.mask & IN_Q_OVERFLOW:
+        watch = event.owner
+        if watch is None or not watch.active or event.mask & IN_UNMOUNT:
+            return
+        src = watch.sync_item.rsync_item.src
+    recorder.record(src, event.names(), event.path)
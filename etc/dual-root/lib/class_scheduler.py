@@ -0,0 +1,505 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - Sync Scheduler
+
+One scheduler runs the syncs for all SyncItems:
+ - Priority queue ordered by due time (then item priority).
+ - Change events are debounced per item (see debounce::Debounce):
+   due once quiet for sync_delay, but no later than sync_max_latency
+   after the first event.
+ - Fixed pool of worker threads.
+ - Workers sleep on a condition variable until the earliest due time,
+   or until woken by a new request, finished sync or shutdown.
+ - At most one sync per item runs at a time. Requests arriving while
+   an item is being synced are run once it finishes.
+ - Optionally, while system pressure (PSI) is high, syncs of items
+   which are not critical are deferred - but no more than max_defer
+   seconds, so replicas do not drift too far behind.
+ - Event to replica latency: time from the first change event not yet
+   synced to the end of the successful sync covering it, is recorded
+   in the item's latency (see sync_latency::SyncLatency).
+ - Clock, wait and the sync itself can be replaced, e.g. to run it
+   with simulated time (see event_replay).
+"""
+# pylint: disable=too-many-instance-attributes
+from typing import (Any)
+from collections.abc import (Callable)
+import heapq
+import itertools
+import threading
+import time
+
+from .sync import sync_one
+from .debounce import Debounce
+from .pressure import PressureGate
+from .run_prog import CancelToken
+from .tracing import trace_event
+
+# while deferred, how often pressure is checked again
+_DEFER_RECHECK = 5.0
+
+
+class _ItemState:
+    """
+    Scheduler state for one SyncItem - protected by scheduler lock.
+    """
+    def __init__(self, item):
+        self.debounce: Debounce = Debounce(item.sync_delay,
+                                           item.sync_max_latency)
+        self.pending: bool = False
+        self.running: bool = False
+        self.last_sync: float = -1
+
+        # due time of the live queue entry (None if not queued)
+        self.due: float | None = None
+        self.generation: int = 0
+
+        # when current pending request was first made
+        self.requested: float | None = None
+
+        # first change event not yet synced, and that of running sync
+        self.first_unsynced: float | None = None
+        self.covering: float | None = None
+
+        # when sync was first held off due to pressure
+        self.deferred_since: float | None = None
+        self.deferred_secs: float = 0
+
+
+class SchedulerStats:
+    """
+    Scheduler counters.
+    """
+    def __init__(self):
+        self.requests: int = 0
+        self.syncs: int = 0
+        self.failures: int = 0
+
+        # seconds from request to start of sync
+        self.wait_last: float = 0
+        self.wait_max: float = 0
+        self.wait_total: float = 0
+
+        # pressure deferral: times a sync was held off, total seconds
+        # syncs were held off and times max_defer forced a sync anyway
+        self.deferrals: int = 0
+        self.deferred_secs: float = 0
+        self.defer_expired: int = 0
+
+
+class SyncScheduler:
+    """
+    Central scheduler for all sync items.
+
+    Args:
+        workers (int):
+            Number of worker threads (syncs that can run at the same time).
+
+        quiet (bool):
+            Less output
+
+        pressure (PressureGate | None):
+            If set, syncs of non critical items wait while it reports busy.
+
+        max_defer (float):
+            Longest a sync is held off due to pressure.
+
+        clock (Callable[[], float]):
+            Current time.
+
+        wait (Callable[[threading.Condition, float | None], bool]):
+            Wait on the scheduler's condition (held) with timeout.
+
+        sync_func (Callable[[Any, bool], bool]):
+            Syncs an item: sync_func(item, quiet) -> success.
+    """
+    # pylint: disable=too-many-arguments, too-many-positional-arguments
+    def __init__(self, workers: int = 2, quiet: bool = False,
+                 pressure: PressureGate | None = None,
+                 max_defer: float = 600,
+                 clock: Callable[[], float] = time.time,
+                 wait: Callable[[threading.Condition, float | None], bool]
+                 = threading.Condition.wait,
+                 sync_func: Callable[[Any, bool], bool] = sync_one):
+        self.quiet: bool = quiet
+        self.num_workers: int = max(1, workers)
+        self.pressure: PressureGate | None = None
+        if pressure is not None and pressure.enabled():
+            self.pressure = pressure
+        self.max_defer: float = max(0, max_defer)
+        self._clock: Callable[[], float] = clock
+        self._wait: Callable[[threading.Condition, float | None], bool] = wait
+        self._sync_func: Callable[[Any, bool], bool] = sync_func
+
+        self._cond = threading.Condition()
+        self._queue: list[tuple[float, int, int, int, Any]] = []
+        self._seq = itertools.count()
+        self._states: dict[int, _ItemState] = {}
+        self._stopping: bool = False
+        self._draining: bool = False
+        self._threads: list[threading.Thread] = []
+
+        self.stats: SchedulerStats = SchedulerStats()
+
+        # stops running rsyncs (see shutdown())
+        self.cancel: CancelToken = CancelToken()
+
+    def _state(self, item) -> _ItemState:
+        """ lock held """
+        state = self._states.get(id(item))
+        if state is None:
+            state = _ItemState(item)
+            self._states[id(item)] = state
+        return state
+
+    def start(self):
+        """
+        Start the worker threads.
+        """
+        with self._cond:
+            if self._threads:
+                return
+            self._stopping = False
+            if self.cancel.is_cancelled():
+                self.cancel.close()
+                self.cancel = CancelToken()
+            for num in range(self.num_workers):
+                thread = threading.Thread(target=self._worker,
+                                          name=f'dual-root-sync-{num}',
+                                          daemon=True)
+                self._threads.append(thread)
+                thread.start()
+
+    def request(self, item, delay: float | None = None):
+        """
+        Request a sync of item.
+
+        Args:
+            item (SyncItem):
+                What to sync.
+
+            delay (float | None):
+                Run no sooner than this many seconds from now.
+                None means this is a change event and is debounced:
+                runs once no events for sync_delay seconds, or at most
+                sync_max_latency seconds after first unsynced event.
+        """
+        if not self._threads:
+            self.start()
+
+        now = self._clock()
+        with self._cond:
+            state = self._state(item)
+            state.pending = True
+            if state.requested is None:
+                state.requested = now
+            self.stats.requests += 1
+            if delay is None and state.first_unsynced is None:
+                state.first_unsynced = now
+
+            if self._draining:
+                self._push(item, state, now)
+
+            elif delay is None:
+                state.debounce.event(now)
+                due = state.debounce.deadline()
+                if state.deferred_since is not None and state.due is not None:
+                    # held off by pressure - keep its recheck time
+                    pass
+                elif due is not None:
+                    self._push(item, state, due, replace=True)
+
+            else:
+                self._push(item, state, now + delay)
+
+            trace_event('sync_request', src=item.rsync_item.src, delay=delay,
+                        due=state.due, running=state.running,
+                        events=state.debounce.num_events)
+
+    def _push(self, item, state: _ItemState, due: float,
+              replace: bool = False):
+        """
+        Queue item to run at due (lock held).
+         - replace: due replaces any existing entry
+         - otherwise an existing earlier entry wins.
+        """
+        if state.due is not None:
+            if state.due == due or (state.due < due and not replace):
+                return
+
+        state.generation += 1
+        state.due = due
+        entry = (due, item.priority, next(self._seq), state.generation, item)
+        heapq.heappush(self._queue, entry)
+        self._cond.notify()
+
+    def _next_item(self):
+        """
+        Wait for next item which is due (lock held)
+
+        Returns:
+            SyncItem | None:
+            None when stopping.
+        """
+        sampled = False
+        while not self._stopping:
+            # drop stale entries
+            while self._queue:
+                (_due, _prio, _seq, gen, item) = self._queue[0]
+                state = self._state(item)
+                if gen == state.generation and state.due is not None:
+                    break
+                heapq.heappop(self._queue)
+
+            if not self._queue:
+                self._wait(self._cond, None)
+                sampled = False
+                continue
+
+            (due, _prio, _seq, _gen, item) = self._queue[0]
+            now = self._clock()
+            if due > now:
+                self._wait(self._cond, due - now)
+                sampled = False
+                continue
+
+            pressure = self.pressure
+            if (not sampled and pressure is not None and pressure.stale()
+                    and self._may_defer(item)):
+                # read pressure files without holding the lock
+                self._cond.release()
+                try:
+                    pressure.busy()
+                finally:
+                    self._cond.acquire()
+                sampled = True
+                continue
+
+            heapq.heappop(self._queue)
+            state = self._state(item)
+            state.due = None
+            if state.running:
+                # picked up again when current sync finishes
+                continue
+
+            if self._defer(item, state, now):
+                continue
+
+            state.running = True
+            state.pending = False
+            state.debounce.reset()
+            state.last_sync = now
+            if state.requested is not None:
+                wait = now - state.requested
+                self.stats.wait_last = wait
+                self.stats.wait_total += wait
+                self.stats.wait_max = max(self.stats.wait_max, wait)
+            state.requested = None
+            state.covering = state.first_unsynced
+            state.first_unsynced = None
+            trace_event('sync_start', src=item.rsync_item.src,
+                        late=now - due)
+            return item
+        return None
+
+    def _may_defer(self, item) -> bool:
+        """ True if item can be held off due to pressure (lock held) """
+        return (self.pressure is not None and self.max_defer > 0
+                and not self._draining and not item.critical)
+
+    def _defer(self, item, state: _ItemState, now: float) -> bool:
+        """
+        Hold off sync of item if system is under pressure (lock held).
+        Uses the last pressure reading - _next_item() refreshes it
+        outside the lock.
+
+        Returns:
+            bool: True if deferred (and requeued).
+        """
+        if self.pressure is None or not self._may_defer(item):
+            return False
+
+        busy = self.pressure.last()
+        if state.deferred_since is None:
+            if not busy:
+                return False
+            state.deferred_since = now
+            self.stats.deferrals += 1
+            trace_event('sync_deferred', src=item.rsync_item.src, busy=busy)
+            if not self.quiet:
+                print(f'Sync {item.rsync_item.src} deferred: '
+                      f'{", ".join(busy)} pressure')
+
+        held = now - state.deferred_since
+        if held >= self.max_defer:
+            self.stats.defer_expired += 1
+        elif busy:
+            due = min(now + _DEFER_RECHECK,
+                      state.deferred_since + self.max_defer)
+            self._push(item, state, due)
+            return True
+
+        state.deferred_since = None
+        state.deferred_secs += held
+        self.stats.deferred_secs += held
+        return False
+
+    def _worker(self):
+        """
+        Worker thread: run syncs as they become due.
+        """
+        while True:
+            with self._cond:
+                item = self._next_item()
+            if item is None:
+                return
+
+            okay = False
+            try:
+                okay = self._sync_func(item, item.quiet)
+            except Exception as err:         # pylint: disable=broad-except
+                print(f'Sync {item.rsync_item.src} failed: {err}')
+
+            with self._cond:
+                state = self._state(item)
+                state.running = False
+                self.stats.syncs += 1
+                if not okay:
+                    self.stats.failures += 1
+                self._sync_done(item, state, okay)
+
+                if state.pending:
+                    # requests arrived while running
+                    now = self._clock()
+                    due = state.debounce.deadline()
+                    if due is None or self._draining:
+                        due = now
+                    self._push(item, state, max(now, due))
+                self._cond.notify_all()
+
+    def _sync_done(self, item, state: _ItemState, okay: bool):
+        """
+        Record event to replica latency (lock held).
+         - failed: events are still unsynced, next sync covers them.
+        """
+        covering = state.covering
+        state.covering = None
+        if covering is None:
+            return
+
+        if not okay:
+            if state.first_unsynced is None:
+                state.first_unsynced = covering
+            else:
+                state.first_unsynced = min(state.first_unsynced, covering)
+            return
+
+        latency = self._clock() - covering
+        if not item.latency.add(latency):
+            print(f'Warning: sync {item.rsync_item.src} latency'
+                  f' {latency:.1f} secs exceeds slo {item.latency.slo} secs')
+
+    def is_running(self, item) -> bool:
+        """ True if item currently being synced """
+        with self._cond:
+            return self._state(item).running
+
+    def is_pending(self, item) -> bool:
+        """ True if item has sync requested but not yet started """
+        with self._cond:
+            return self._state(item).pending
+
+    def last_sync(self, item) -> float:
+        """ time last sync of item started (-1 if never) """
+        with self._cond:
+            return self._state(item).last_sync
+
+    def deferred_secs(self, item) -> float:
+        """ total seconds syncs of item were held off by pressure """
+        with self._cond:
+            return self._state(item).deferred_secs
+
+    def queue_depth(self) -> int:
+        """ Number of items waiting to be synced """
+        with self._cond:
+            return sum(1 for state in self._states.values()
+                       if state.due is not None)
+
+    def oldest_wait(self) -> float:
+        """ Seconds the longest waiting request has been waiting """
+        now = self._clock()
+        with self._cond:
+            waits = [now - state.requested for state in self._states.values()
+                     if state.requested is not None]
+        return max(waits, default=0)
+
+    def wait_idle(self, item=None, timeout: float | None = None) -> bool:
+        """
+        Wait until nothing is queued or running.
+
+        Args:
+            item (SyncItem | None):
+                Only wait for this item.
+
+            timeout (float | None):
+                Give up after this many seconds.
+
+        Returns:
+            bool: True if idle, False on timeout.
+        """
+        def idle() -> bool:
+            if item is not None:
+                states = [self._state(item)]
+            else:
+                states = list(self._states.values())
+            return not any(state.running or state.due is not None
+                           for state in states)
+
+        with self._cond:
+            return self._cond.wait_for(idle, timeout=timeout)
+
+    def shutdown(self, drain: bool = True, timeout: float | None = None):
+        """
+        Stop the scheduler.
+
+        Args:
+            drain (bool):
+                If True, any pending syncs are run now and completed first.
+                Otherwise any running syncs are cancelled.
+
+            timeout (float | None):
+                Longest to wait for drain, after which running
+                syncs are cancelled.
+        """
+        if drain:
+            with self._cond:
+                self._draining = True
+                now = self._clock()
+                for state in self._states.values():
+                    if state.due is not None:
+                        state.due = now
+                        state.generation += 1
+                entries = self._queue
+                self._queue = []
+                for (_due, prio, seq, _gen, item) in entries:
+                    state = self._state(item)
+                    if state.due is not None:
+                        heapq.heappush(self._queue,
+                                       (now, prio, seq, state.generation, item))
+                self._cond.notify_all()
+            if not self.wait_idle(timeout=timeout):
+                print('Sync scheduler: timed out waiting - cancelling syncs')
+                drain = False
+
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+        if not drain:
+            self.cancel.cancel()
+
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+        self._draining = False
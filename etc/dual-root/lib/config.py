@@ -4,13 +4,12 @@
 Command line options
 """
 # pylint: disable=too-many-instance-attributes, too-few-public-methods
+# pylint: disable=import-outside-toplevel
 from typing import (Any)
 import argparse
 
-from ._read_config import read_config
-
 type _Opt = tuple[str | tuple[str, str] | tuple[str, str, str], dict[str, Any]]
-type SyncListElem = tuple[str, list[str], list[str]]
+type SyncListElem = tuple[str, list[str], list[str], dict[str, Any]]
 
 
 def _avail_options(conf_file: str, efi_mount: str) -> list[_Opt]:
@@ -88,7 +87,30 @@ class Config:
         self.nice: int = 19
         self.ionice_class: int = 3  # 0=idle
         self.ionice_level: int = 6
-        self.sync_delay: float = 300
+        self.sync_delay: float = 30
+        self.sync_max_latency: float = 300
+        self.sync_latency_slo: float = 0
+        self.inotify_backend: str = 'native'
+        self.full_sync_interval: float = 86400
+        self.rsync_batch: bool = True
+        self.dest_workers: int = 4
+        self.sync_threads: int = 2
+        self.cgroup: bool = False
+        self.io_weight: int = 0
+        self.io_max: str = ''
+        self.cpu_weight: int = 0
+        self.pressure_io: float = 0
+        self.pressure_cpu: float = 0
+        self.pressure_memory: float = 0
+        self.pressure_max_defer: float = 600
+        self.rsync_timeout: float = 0
+        self.shutdown_timeout: float = 60
+        self.metrics_file: str = ''
+        self.metrics_interval: float = 30
+        self.trace_file: str = ''
+        self.profile_dir: str = ''
+        self.profile_secs: float = 60
+        self.event_trace_file: str = ''
         self.sync_list: list[SyncListElem] = []
 
         #
@@ -104,10 +126,17 @@ class Config:
 
         parse_args(self)
 
+        #
+        # Bind mount (boot time) needs nothing from config file
+        #
+        if self.bind_only:
+            return
+
         #
         # Now we know config filename, read it
         # and map to our attributes
         #
+        from ._read_config import read_config
         config_dict = read_config(self.config_file)
 
         for (key, val) in config_dict.items():
@@ -116,6 +145,13 @@ class Config:
         if self.syncd:
             self.sync = True
 
+    @property
+    def bind_only(self) -> bool:
+        """
+        Only bind mounting - e.g. at boot time
+        """
+        return self.bind and not (self.sync or self.syncd)
+
 
 def parse_args(conf: Config):
     """
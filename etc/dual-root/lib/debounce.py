@@ -0,0 +1,72 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - debounce change events.
+
+A burst of events is coalesced into one sync which fires once things
+have been quiet for a while (trailing edge). To make sure a
+continuously busy tree is still synced, it also fires no later than
+max_latency after the first event of the burst.
+
+Time is always passed in, so the same logic can be driven by a
+simulated clock.
+"""
+
+
+class Debounce:
+    """
+    Debounce timer for one sync item.
+
+    Args:
+        quiet (float):
+            Seconds with no events before firing.
+
+        max_latency (float):
+            Fire no later than this many seconds after the first
+            unsynced event. 0 means no limit.
+    """
+    def __init__(self, quiet: float, max_latency: float = 0):
+        self.quiet: float = max(0, quiet)
+        self.max_latency: float = max(0, max_latency)
+
+        self.first_event: float | None = None
+        self.last_event: float | None = None
+        self.num_events: int = 0
+
+    def event(self, now: float):
+        """
+        Record an event at time now.
+        """
+        if self.first_event is None:
+            self.first_event = now
+        self.last_event = now
+        self.num_events += 1
+
+    def deadline(self) -> float | None:
+        """
+        Time to fire.
+
+        Returns:
+            float | None:
+            None if there are no events waiting.
+        """
+        if self.first_event is None or self.last_event is None:
+            return None
+
+        due = self.last_event + self.quiet
+        if self.max_latency > 0:
+            due = min(due, self.first_event + self.max_latency)
+        return due
+
+    def is_due(self, now: float) -> bool:
+        """ True if events waiting and deadline has been reached """
+        due = self.deadline()
+        return due is not None and due <= now
+
+    def reset(self):
+        """
+        Events handed off (sync started) - start over.
+        """
+        self.first_event = None
+        self.last_event = None
+        self.num_events = 0
@@ -0,0 +1,140 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - read booted esp directly from efivarfs.
+
+BootCurrent holds the number of the boot entry used for this boot.
+The matching Boot#### variable is an EFI_LOAD_OPTION whose device
+path contains a hard drive media node with the GPT partition GUID
+(PARTUUID) of the esp.
+
+Each efivarfs file starts with 4 bytes of attributes followed by the data.
+
+The efivars directory can be given, so this can be run against
+a directory of saved efivars.
+"""
+import os
+import struct
+
+EFIVARS_DIR = '/sys/firmware/efi/efivars'
+EFI_GLOBAL_GUID = '8be4df61-93ca-11d2-aa0d-00e098032b8c'
+
+# Device path node types
+_MEDIA_DEVICE_PATH = 0x04
+_MEDIA_HARDDRIVE_DP = 0x01
+_END_DEVICE_PATH = 0x7f
+
+# Hard drive node signature type
+_SIGNATURE_TYPE_GUID = 0x02
+
+
+def _read_efivar(efivars_dir: str, name: str) -> bytes | None:
+    """
+    Data of efi global variable name (attributes removed)
+    """
+    path = os.path.join(efivars_dir, f'{name}-{EFI_GLOBAL_GUID}')
+    try:
+        with open(path, 'rb') as fobj:
+            data = fobj.read()
+    except OSError:
+        return None
+
+    if len(data) < 4:
+        return None
+    return data[4:]
+
+
+def boot_current(efivars_dir: str = EFIVARS_DIR) -> int | None:
+    """
+    Boot entry number used for current boot.
+
+    Returns:
+        int | None:
+        None if not available.
+    """
+    data = _read_efivar(efivars_dir, 'BootCurrent')
+    if data is None or len(data) < 2:
+        return None
+    return struct.unpack_from('<H', data)[0]
+
+
+def load_option_partuuid(data: bytes) -> str:
+    """
+    Extract GPT partition GUID from an EFI_LOAD_OPTION.
+
+    EFI_LOAD_OPTION:
+        u32 Attributes
+        u16 FilePathListLength
+        u16 Description[] - UCS-2 NUL terminated
+        FilePathList[]    - device path nodes
+        u8  OptionalData[]
+
+    Device path node:
+        u8 Type, u8 SubType, u16 Length, data
+
+    Hard drive media node (type 4, sub type 1):
+        u32 PartitionNumber, u64 PartitionStart, u64 PartitionSize,
+        u8 Signature[16], u8 MBRType, u8 SignatureType
+
+    Returns:
+        str:
+        Lower case partuuid, or '' if not found.
+    """
+    if len(data) < 6:
+        return ''
+
+    path_len = struct.unpack_from('<H', data, 4)[0]
+
+    # skip description
+    offset = 6
+    while offset + 1 < len(data):
+        if data[offset] == 0 and data[offset + 1] == 0:
+            offset += 2
+            break
+        offset += 2
+
+    end = min(offset + path_len, len(data))
+    while offset + 4 <= end:
+        (node_type, sub_type, node_len) = struct.unpack_from('<BBH', data,
+                                                             offset)
+        if node_len < 4 or node_type == _END_DEVICE_PATH:
+            break
+
+        if (node_type == _MEDIA_DEVICE_PATH
+                and sub_type == _MEDIA_HARDDRIVE_DP and node_len >= 42):
+            sig = data[offset + 24:offset + 40]
+            sig_type = data[offset + 41]
+            if sig_type == _SIGNATURE_TYPE_GUID:
+                return _guid_str(sig)
+
+        offset += node_len
+
+    return ''
+
+
+def _guid_str(guid: bytes) -> str:
+    """
+    EFI GUID (mixed endian) as text: first 3 fields little endian.
+    """
+    (part1, part2, part3) = struct.unpack_from('<IHH', guid)
+    tail = guid[8:].hex()
+    return f'{part1:08x}-{part2:04x}-{part3:04x}-{tail[:4]}-{tail[4:]}'
+
+
+def booted_esp_partuuid_efivars(efivars_dir: str = EFIVARS_DIR) -> str:
+    """
+    Partuuid of the esp used for current boot, read from efivars.
+
+    Returns:
+        str:
+        '' if efivars is not available or the partuuid is not found.
+    """
+    bootnum = boot_current(efivars_dir)
+    if bootnum is None:
+        return ''
+
+    data = _read_efivar(efivars_dir, f'Boot{bootnum:04X}')
+    if data is None:
+        return ''
+
+    return load_option_partuuid(data)
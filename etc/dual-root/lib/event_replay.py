@@ -0,0 +1,213 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - replay recorded events with a simulated clock.
+
+Answers: with this sync_delay / sync_max_latency, how many syncs would
+have run and how far behind would the replicas have been?
+
+Events (see event_trace) are fed to the sync scheduler (see
+class_scheduler::SyncScheduler), running with a simulated clock:
+ - due once quiet for sync_delay, no later than sync_max_latency
+   after the first unsynced event
+ - one sync per item at a time, taking sync_secs (nothing is run).
+   Events arriving meanwhile are synced once it finishes.
+ - latency is first unsynced event to end of sync covering it.
+
+There is one worker per item, so items do not wait for each other,
+and no pressure deferral. No real time passes while replaying.
+"""
+from typing import (Any)
+import itertools
+import math
+import threading
+
+from ._syncitem_base import RsyncItem
+from .class_scheduler import SyncScheduler
+from .sync_latency import SyncLatency
+
+
+class SimClock:
+    """
+    Simulated time for the scheduler (its clock and wait).
+
+    Worker threads block in wait() (idle) or sleep() (syncing) until
+    run_until() moves the clock on. Time only moves once every worker
+    is blocked, so results do not depend on thread timing.
+
+    Args:
+        start (float):
+            Initial time.
+
+        workers (int):
+            Number of scheduler worker threads.
+    """
+    def __init__(self, start: float, workers: int):
+        self.now: float = start
+        self.workers: int = workers
+
+        self._cv = threading.Condition()
+        self._tokens = itertools.count()
+        self._stopped: bool = False
+
+        # token -> time blocked worker is to wake up
+        self._waiting: dict[int, float] = {}
+        self._sleeping: dict[int, float] = {}
+
+    def time(self) -> float:
+        """ current simulated time """
+        return self.now
+
+    def wait(self, cond: threading.Condition, timeout: float | None) -> bool:
+        """
+        Scheduler wait: cond is held on entry and on return.
+        """
+        deadline = math.inf if timeout is None else self.now + timeout
+        cond.release()
+        try:
+            self._block(self._waiting, deadline)
+        finally:
+            cond.acquire()
+        return self.now < deadline
+
+    def sleep(self, secs: float):
+        """ worker is busy for secs """
+        self._block(self._sleeping, self.now + secs)
+
+    def _block(self, blocked: dict[int, float], deadline: float):
+        """ until woken by run_until() """
+        with self._cv:
+            if self._stopped:
+                return
+            token = next(self._tokens)
+            blocked[token] = deadline
+            self._cv.notify_all()
+            while token in blocked:
+                self._cv.wait()
+
+    def _settle(self):
+        """ wait until all workers are blocked (lock held) """
+        while len(self._waiting) + len(self._sleeping) < self.workers:
+            self._cv.wait()
+
+    def _wake(self, blocked: dict[int, float], until: float = math.inf):
+        """ wake those due by until (lock held) """
+        for (token, deadline) in list(blocked.items()):
+            if deadline <= until:
+                del blocked[token]
+        self._cv.notify_all()
+
+    def run_until(self, until: float):
+        """
+        Move time up to until, letting the workers run all that is due.
+         - waiting workers are always woken to look at the queue, as a
+           request or finished sync may have changed it.
+        """
+        with self._cv:
+            self._wake(self._waiting)
+            while True:
+                self._settle()
+                due = min(itertools.chain(self._waiting.values(),
+                                          self._sleeping.values()),
+                          default=math.inf)
+                if due > until or math.isinf(due):
+                    if not math.isinf(until):
+                        self.now = max(self.now, until)
+                    return
+
+                self.now = max(self.now, due)
+                self._wake(self._sleeping, self.now)
+                self._settle()
+                self._wake(self._waiting)
+
+    def stop(self):
+        """ release all workers - they no longer block """
+        with self._cv:
+            self._stopped = True
+            self._waiting.clear()
+            self._sleeping.clear()
+            self._cv.notify_all()
+
+
+class ReplayItem:
+    """
+    Sync item as seen by the scheduler, with replay results.
+
+    Args:
+        src (str):
+            Source of item.
+
+        delay (float):
+            sync_delay
+
+        max_latency (float):
+            sync_max_latency
+    """
+    # pylint: disable=too-many-instance-attributes, too-few-public-methods
+    def __init__(self, src: str, delay: float, max_latency: float):
+        self.rsync_item: RsyncItem = RsyncItem(src, [], [], [])
+        self.sync_delay: float = delay
+        self.sync_max_latency: float = max_latency
+        self.priority: int = 0
+        self.critical: bool = False
+        self.quiet: bool = True
+
+        self.events: int = 0
+        self.syncs: int = 0
+        self.latency: SyncLatency = SyncLatency(size=100000)
+
+    def summary(self) -> dict[str, Any]:
+        """ results """
+        info: dict[str, Any] = {'src': self.rsync_item.src,
+                                'events': self.events, 'syncs': self.syncs}
+        lat = self.latency.summary()
+        for key in ('p50', 'p95', 'max'):
+            info[f'lag_{key}_secs'] = round(lat[key], 3)
+        return info
+
+
+def replay_events(events: list[dict[str, Any]], delay: float,
+                  max_latency: float,
+                  sync_secs: float = 1.0) -> list[ReplayItem]:
+    """
+    Replay events (sorted by time) for one debounce policy.
+
+    Events with empty src (queue overflow) apply to every item.
+
+    Returns:
+        list[ReplayItem]:
+        One per source seen in events.
+    """
+    items: dict[str, ReplayItem] = {}
+    for rec in events:
+        src = rec['src']
+        if src and src not in items:
+            items[src] = ReplayItem(src, delay, max_latency)
+    if not items:
+        return []
+
+    clock = SimClock(float(events[0]['t']), len(items))
+    sync_secs = max(0, sync_secs)
+
+    def sync_func(item: ReplayItem, _quiet: bool) -> bool:
+        item.syncs += 1
+        clock.sleep(sync_secs)
+        return True
+
+    scheduler = SyncScheduler(workers=len(items), quiet=True,
+                              clock=clock.time, wait=clock.wait,
+                              sync_func=sync_func)
+    scheduler.start()
+    try:
+        for rec in events:
+            clock.run_until(float(rec['t']))
+            src = rec['src']
+            targets = [items[src]] if src else list(items.values())
+            for item in targets:
+                item.events += 1
+                scheduler.request(item)
+        clock.run_until(math.inf)
+    finally:
+        clock.stop()
+        scheduler.shutdown(drain=False)
+    return list(items.values())
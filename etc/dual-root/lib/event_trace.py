@@ -0,0 +1,139 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - record inotify events the daemon acts on.
+
+Each event is one JSON line:
+    {"t": 1700000000.123456, "src": "/efi0/", "ev": "CREATE,ISDIR",
+     "path": "/efi0/EFI/Linux"}
+  - t     : wall clock time event was handled
+  - src   : source of sync item ("" for queue overflow - all items)
+  - ev    : event names as reported by inotifywait
+  - path  : what changed
+
+Traces can be replayed offline with different debounce settings
+(see event_replay and scripts/replay-events).
+
+Enabled by config event_trace_file or environment
+DUAL_ROOT_EVENT_TRACE_FILE.
+"""
+from typing import (Any, IO)
+import json
+import os
+import threading
+import time
+
+ENV_EVENT_TRACE_FILE = 'DUAL_ROOT_EVENT_TRACE_FILE'
+
+
+class EventRecorder:
+    """
+    Append events to trace file.
+
+    Written buffered - flush() once per batch of events.
+
+    Args:
+        path (str):
+            Trace file (appended to).
+    """
+    def __init__(self, path: str):
+        self.path: str = path
+        self._lock = threading.Lock()
+        self._fobj: IO[str] | None = None
+        self.num_events: int = 0
+
+        try:
+            self._fobj = open(path, 'a', encoding='utf-8')
+        except OSError as err:
+            print(f'Event trace disabled - cannot open {path}: {err}')
+
+    @property
+    def okay(self) -> bool:
+        """ recording """
+        return self._fobj is not None
+
+    def record(self, src: str, events: list[str], path: str,
+               now: float | None = None):
+        """
+        One event.
+        """
+        if now is None:
+            now = time.time()
+        rec = {'t': round(now, 6), 'src': src, 'ev': ','.join(events),
+               'path': path}
+        line = json.dumps(rec, separators=(',', ':'))
+
+        with self._lock:
+            if self._fobj is None:
+                return
+            try:
+                self._fobj.write(line + '\n')
+                self.num_events += 1
+            except OSError as err:
+                print(f'Event trace stopped - write failed: {err}')
+                self._close()
+
+    def flush(self):
+        """ write out buffered events """
+        with self._lock:
+            if self._fobj is None:
+                return
+            try:
+                self._fobj.flush()
+            except OSError as err:
+                print(f'Event trace stopped - write failed: {err}')
+                self._close()
+
+    def close(self):
+        """ all done """
+        with self._lock:
+            self._close()
+
+    def _close(self):
+        """ lock held """
+        if self._fobj is not None:
+            try:
+                self._fobj.close()
+            except OSError:
+                pass
+            self._fobj = None
+
+
+def event_recorder(trace_file: str) -> EventRecorder | None:
+    """
+    Recorder if asked for - environment overrides config.
+    """
+    trace_file = os.environ.get(ENV_EVENT_TRACE_FILE, trace_file)
+    if not trace_file:
+        return None
+
+    recorder = EventRecorder(trace_file)
+    if not recorder.okay:
+        return None
+    print(f'Recording events to {trace_file}')
+    return recorder
+
+
+def read_event_trace(path: str) -> list[dict[str, Any]]:
+    """
+    Read trace file - bad lines are skipped.
+
+    Returns:
+        list[dict[str, Any]]:
+        Events sorted by time.
+    """
+    events: list[dict[str, Any]] = []
+    try:
+        with open(path, 'r', encoding='utf-8') as fobj:
+            for line in fobj:
+                try:
+                    rec = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if isinstance(rec, dict) and 't' in rec and 'src' in rec:
+                    events.append(rec)
+    except OSError as err:
+        print(f'Failed to read event trace {path}: {err}')
+
+    events.sort(key=lambda rec: rec['t'])
+    return events
@@ -0,0 +1,380 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - native (in process) inotify support.
+
+One inotify file descriptor serves every watched tree. Kernel events
+are read in bulk and parsed from the binary inotify_event struct, so
+there are no child processes and no text to parse.
+
+Recursive watches are managed here: new directories get watches as
+they appear and watches are dropped when directories go away.
+
+Trees may overlap (e.g. /usr and /usr/lib). The kernel has one watch
+per directory, so an event below both roots is handed back once for
+each owner, and a directory keeps its watch until no tree needs it.
+
+See class_inotify::Inotify
+"""
+# pylint: disable=too-many-instance-attributes
+from typing import (Any)
+from collections.abc import (Callable)
+import os
+import struct
+
+from ._libc import (libc, errno_error)
+
+#
+# From <sys/inotify.h>
+#
+IN_ACCESS = 0x00000001
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_UNMOUNT = 0x00002000
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_ISDIR = 0x40000000
+
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = os.O_CLOEXEC
+
+#
+# Same events as: inotifywait -e attrib,create,move,modify,delete,unmount
+# (unmount is always reported by the kernel).
+#
+WATCH_MASK = (IN_ATTRIB | IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO
+              | IN_MODIFY | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+              | IN_ONLYDIR | IN_DONT_FOLLOW)
+
+# mask bit -> name as used by inotifywait
+_EVENT_NAMES = ((IN_ACCESS, 'ACCESS'), (IN_MODIFY, 'MODIFY'),
+                (IN_ATTRIB, 'ATTRIB'), (IN_CLOSE_WRITE, 'CLOSE_WRITE'),
+                (IN_MOVED_FROM, 'MOVED_FROM'), (IN_MOVED_TO, 'MOVED_TO'),
+                (IN_CREATE, 'CREATE'), (IN_DELETE, 'DELETE'),
+                (IN_DELETE_SELF, 'DELETE_SELF'), (IN_MOVE_SELF, 'MOVE_SELF'),
+                (IN_UNMOUNT, 'UNMOUNT'), (IN_Q_OVERFLOW, 'Q_OVERFLOW'),
+                (IN_IGNORED, 'IGNORED'), (IN_ISDIR, 'ISDIR'))
+
+_EVENT_STRUCT = struct.Struct('iIII')
+_EVENT_SIZE = _EVENT_STRUCT.size
+_READ_SIZE = 64 * 1024
+
+
+class InotifyEvent:
+    """
+    One parsed inotify event.
+
+    Attributes:
+        wd (int):
+            watch descriptor the event arrived on (-1 for overflow).
+
+        mask (int):
+            inotify event mask.
+
+        cookie (int):
+            links IN_MOVED_FROM/IN_MOVED_TO pairs.
+
+        path (str):
+            full path of the object the event refers to.
+
+        owner (Any):
+            whoever added the watch tree (see InotifyNative.add_tree()).
+    """
+    __slots__ = ('wd', 'mask', 'cookie', 'path', 'owner')
+
+    def __init__(self, wd: int, mask: int, cookie: int, path: str,
+                 owner: Any):
+        self.wd: int = wd
+        self.mask: int = mask
+        self.cookie: int = cookie
+        self.path: str = path
+        self.owner: Any = owner
+
+    def is_dir(self) -> bool:
+        """ event refers to a directory """
+        return bool(self.mask & IN_ISDIR)
+
+    def is_tree(self) -> bool:
+        """
+        Everything at and below path may have changed.
+        True for directory events (created, deleted, moved ...)
+        """
+        return bool(self.mask & (IN_ISDIR | IN_DELETE_SELF | IN_MOVE_SELF))
+
+    def names(self) -> list[str]:
+        """ event names (as inotifywait) e.g. ['CREATE', 'ISDIR'] """
+        return [name for (bit, name) in _EVENT_NAMES if self.mask & bit]
+
+
+class InotifyNative:
+    """
+    Single inotify instance holding recursive watches on one or more trees.
+
+     - add_tree() for each tree to be watched.
+     - fileno() is suitable for select/epoll.
+     - read_events() returns all queued events (non-blocking).
+
+    Each tree has an owner, returned with every event for that tree.
+    Events in overlapping trees are returned once per owner.
+    """
+    def __init__(self):
+        self.okay: bool = True
+        self.fd: int = -1
+
+        # wd -> directory path
+        self.wd_path: dict[int, str] = {}
+        # directory path -> wd
+        self.path_wd: dict[str, int] = {}
+
+        # watched tree roots -> owner and -> directories not to watch
+        self.roots: dict[str, Any] = {}
+        self.root_skip: dict[str, Callable[[str], bool]] = {}
+
+        self._lib = libc()
+        self.fd = self._lib.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            self.okay = False
+            raise errno_error('inotify_init1')
+
+    def fileno(self) -> int:
+        """ inotify file descriptor """
+        return self.fd
+
+    def close(self):
+        """
+        Close inotify - kernel drops all watches.
+        """
+        if self.fd >= 0:
+            try:
+                os.close(self.fd)
+            except OSError:
+                pass
+        self.fd = -1
+        self.wd_path = {}
+        self.path_wd = {}
+        self.roots = {}
+        self.root_skip = {}
+
+    def num_watches(self) -> int:
+        """ number of directories being watched """
+        return len(self.wd_path)
+
+    def add_tree(self, root: str, owner: Any,
+                 skip: Callable[[str], bool] | None = None) -> int:
+        """
+        Recursively watch every directory under root.
+
+        Args:
+            root (str):
+                top of tree to watch.
+
+            owner (Any):
+                returned with each event for this tree.
+
+            skip (Callable[[str], bool] | None):
+                Called with directory path, True means neither it nor
+                anything below it is watched (e.g. excluded from sync).
+                Applies to directories created later as well.
+
+        Returns:
+            int:
+            Number of directories watched. 0 means root could not be watched.
+        """
+        root = _norm_path(root)
+        self.roots[root] = owner
+        if skip is not None:
+            self.root_skip[root] = skip
+        count = self._add_subtree(root)
+        if count < 1:
+            del self.roots[root]
+            self.root_skip.pop(root, None)
+        return count
+
+    def remove_tree(self, root: str):
+        """
+        Stop watching tree at root.
+        Directories still needed by another (overlapping) tree keep
+        their watch.
+        """
+        root = _norm_path(root)
+        self.roots.pop(root, None)
+        self.root_skip.pop(root, None)
+        self._rm_subtree(root, keep_needed=True)
+
+    def _add_one(self, path: str) -> bool:
+        """
+        Add watch for one directory.
+        The kernel returns same wd for an already watched inode,
+        in that case path is updated (e.g. dir was renamed).
+        """
+        wd = self._lib.inotify_add_watch(self.fd, os.fsencode(path),
+                                         WATCH_MASK)
+        if wd < 0:
+            err = errno_error(f'inotify_add_watch {path}')
+            if err.errno == 28:
+                # ENOSPC : out of watches
+                print(f'inotify: {err} (see fs.inotify.max_user_watches)')
+            return False
+
+        old_path = self.wd_path.get(wd)
+        if old_path is not None and old_path != path:
+            self.path_wd.pop(old_path, None)
+        self.wd_path[wd] = path
+        self.path_wd[path] = wd
+        return True
+
+    def _skipped(self, path: str) -> bool:
+        """
+        True if no tree containing path wants it watched.
+        """
+        skipped = False
+        for root in self.roots:
+            if not _is_under(path, root):
+                continue
+            skip = self.root_skip.get(root)
+            if skip is None or not skip(path):
+                return False
+            skipped = True
+        return skipped
+
+    def _add_subtree(self, top: str) -> int:
+        """
+        Add watches for top and all directories below it.
+        Symlinks are not followed.
+        """
+        count = 0
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            if self._skipped(path):
+                continue
+            if not self._add_one(path):
+                continue
+            count += 1
+            try:
+                with os.scandir(path) as scan:
+                    for entry in scan:
+                        if entry.is_dir(follow_symlinks=False):
+                            stack.append(entry.path)
+            except OSError:
+                # went away or no access - events will tell us
+                pass
+        return count
+
+    def _rm_subtree(self, top: str, keep_needed: bool = False):
+        """
+        Drop watches for top and all directories below it.
+        keep_needed: leave those still inside another watched tree.
+        """
+        prefix = top + '/' if top != '/' else top
+        paths = [path for path in self.path_wd
+                 if path == top or path.startswith(prefix)]
+        if keep_needed:
+            paths = [path for path in paths
+                     if not self.owners_of(path) or self._skipped(path)]
+
+        for path in paths:
+            wd = self.path_wd.pop(path)
+            self.wd_path.pop(wd, None)
+            if self.fd >= 0:
+                self._lib.inotify_rm_watch(self.fd, wd)
+
+    def owners_of(self, path: str) -> list[Any]:
+        """
+        Owners of every watched tree containing path.
+        """
+        return [owner for (root, owner) in self.roots.items()
+                if _is_under(path, root)]
+
+    def read_events(self) -> list[InotifyEvent]:
+        """
+        Read and parse every event currently queued.
+
+        Watches are added for newly created (or moved in) directories
+        and removed for deleted (or moved out) ones, before the events
+        are handed back.
+
+        Returns:
+            list[InotifyEvent]:
+            Empty when nothing is available.
+        """
+        events: list[InotifyEvent] = []
+        while self.fd >= 0:
+            try:
+                buf = os.read(self.fd, _READ_SIZE)
+            except BlockingIOError:
+                break
+            except OSError as err:
+                print(f'inotify read error: {err}')
+                break
+
+            if not buf:
+                break
+            self._parse(buf, events)
+        return events
+
+    def _parse(self, buf: bytes, events: list[InotifyEvent]):
+        """
+        Parse a buffer holding one or more inotify_event structs.
+        """
+        offset = 0
+        end = len(buf)
+        unpack_from = _EVENT_STRUCT.unpack_from
+        while offset + _EVENT_SIZE <= end:
+            (wd, mask, cookie, length) = unpack_from(buf, offset)
+            offset += _EVENT_SIZE
+            name = b''
+            if length:
+                name = buf[offset:offset + length].rstrip(b'\0')
+                offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append(InotifyEvent(-1, mask, cookie, '', None))
+                continue
+
+            dirpath = self.wd_path.get(wd)
+            if dirpath is None:
+                # watch already removed
+                continue
+
+            if mask & IN_IGNORED:
+                self.wd_path.pop(wd, None)
+                if self.path_wd.get(dirpath) == wd:
+                    self.path_wd.pop(dirpath, None)
+                continue
+
+            path = dirpath
+            if name:
+                path = os.path.join(dirpath, os.fsdecode(name))
+
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self._add_subtree(path)
+                elif mask & IN_MOVED_FROM:
+                    self._rm_subtree(path)
+
+            for owner in self.owners_of(path):
+                events.append(InotifyEvent(wd, mask, cookie, path, owner))
+
+
+def _norm_path(path: str) -> str:
+    """ drop any trailing '/' (except root itself) """
+    if len(path) > 1:
+        path = path.rstrip('/')
+    return path
+
+
+def _is_under(path: str, root: str) -> bool:
+    """ True if path is root or below it """
+    if root == '/':
+        return True
+    return path == root or path.startswith(root + '/')
@@ -13,6 +13,8 @@ import signal
 import subprocess
 from subprocess import Popen
 
+from .utils import tool_path
+
 
 def _terminate_w_signals(pid: int):
     """ try sigterm then sigkill if needed """
@@ -55,21 +57,26 @@ def catch_signals(sig_handler: Callable[[int, FrameType | None], None]):
         signal.signal(sig, sig_handler)
 
 
-def popen_one_inotify(watchdir: str) -> Popen | None:
+def popen_one_inotify(watchdir: str, exclude: str = '') -> Popen | None:
     """
     Popen inotifywait in 'monitor' mode
      - return the pipe
-     - use line buffering to ensure we avoid partial events coming back
+     - stdout is unbuffered bytes: it is read directly (non-blocking)
+       and split into lines by the event loop.
+     - exclude: extended regex of paths to ignore (not watched)
     """
     # pylint: disable=R1732
     if not watchdir:
         print('inotify: No watch_dir given')
         return None
 
-    cmd = ['/usr/bin/inotifywait']
+    cmd = [tool_path('inotifywait')]
 
     events = "attrib,create,move,modify,delete,unmount"
-    opts = ['-m', '-r', '-e', events, '--format', '%e', watchdir]
+    opts = ['-m', '-r', '-e', events, '--format', '%e %w%f']
+    if exclude:
+        opts += ['--exclude', exclude]
+    opts.append(watchdir)
     pargs = cmd + opts
 
     cmd_str = ' '.join(pargs)
@@ -80,11 +87,23 @@ def popen_one_inotify(watchdir: str) -> Popen | None:
         pipe = subprocess.Popen(pargs,
                                 stdout=subprocess.PIPE,
                                 stderr=subprocess.DEVNULL,
-                                text=True,
-                                bufsize=1
+                                bufsize=0
                                 )
     except OSError as err:
         pipe = None
         print(f'Failed to start inotify: {err}')
 
     return pipe
+
+
+def parse_event_line(line: str) -> tuple[list[str], str]:
+    """
+    Parse one line of inotifywait output (format '%e %w%f')
+
+    Returns:
+        tuple[events: list[str], path: str]:
+        e.g. (['CREATE', 'ISDIR'], '/etc/foo')
+    """
+    (events, _sep, path) = line.rstrip('\n').partition(' ')
+    event_list = events.split(',') if events else []
+    return (event_list, path)
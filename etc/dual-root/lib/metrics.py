@@ -0,0 +1,280 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - metrics for the prometheus node_exporter textfile collector.
+
+The sync daemon periodically writes all its metrics to a .prom file
+(e.g. /var/lib/node_exporter/textfile/dual-root.prom). The file is
+written to a temporary file in the same directory and renamed,
+so the collector never sees a partial file.
+"""
+# pylint: disable=too-few-public-methods
+from typing import (TYPE_CHECKING)
+import os
+import tempfile
+import threading
+import time
+
+from .rsync_stats import DURATION_BUCKETS
+
+if TYPE_CHECKING:
+    from ._sync import Sync
+
+_PREFIX = 'dual_root'
+
+
+class _PromText:
+    """
+    Build text exposition format - HELP/TYPE once per metric.
+
+    Samples are kept per metric family and written out family by
+    family, as each family must be one group, whatever order
+    they were added in.
+    """
+    def __init__(self):
+        self._families: dict[str, list[str]] = {}
+
+    def add(self, name: str, mtype: str, text: str, value: float,
+            labels: dict[str, str] | None = None):
+        """
+        One sample
+        """
+        name = f'{_PREFIX}_{name}'
+        base = name
+        for suffix in ('_bucket', '_sum', '_count'):
+            if mtype in ('histogram', 'summary') and name.endswith(suffix):
+                base = name[:-len(suffix)]
+                break
+
+        lines = self._families.get(base)
+        if lines is None:
+            lines = [f'# HELP {base} {text}', f'# TYPE {base} {mtype}']
+            self._families[base] = lines
+
+        label_txt = ''
+        if labels:
+            items = [f'{key}="{_escape(val)}"' for (key, val) in labels.items()]
+            label_txt = '{' + ','.join(items) + '}'
+        lines.append(f'{name}{label_txt} {_number(value)}')
+
+    def text(self) -> str:
+        """ all of it """
+        lines: list[str] = []
+        for family in self._families.values():
+            lines += family
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(val: str) -> str:
+    """ label value escaping """
+    return val.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value: float) -> str:
+    """ sample value """
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, int) or float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def metrics_text(sync: 'Sync') -> str:
+    """
+    All daemon metrics in prometheus text format.
+    """
+    # pylint: disable=too-many-locals
+    prom = _PromText()
+    scheduler = sync.scheduler
+    stats = scheduler.stats
+
+    prom.add('up', 'gauge', 'Sync daemon running', 1)
+    prom.add('sync_queue_depth', 'gauge', 'Sync items waiting to be synced',
+             scheduler.queue_depth())
+    prom.add('sync_oldest_wait_seconds', 'gauge',
+             'Longest any sync request has been waiting',
+             scheduler.oldest_wait())
+    prom.add('sync_requests_total', 'counter', 'Sync requests', stats.requests)
+    prom.add('syncs_total', 'counter', 'Syncs run', stats.syncs)
+    prom.add('sync_failures_total', 'counter', 'Syncs which failed',
+             stats.failures)
+    prom.add('sync_wait_seconds_total', 'counter',
+             'Time from request to sync start (debounce and queue)',
+             stats.wait_total)
+    prom.add('sync_wait_seconds_max', 'gauge',
+             'Longest time from request to sync start', stats.wait_max)
+    prom.add('sync_deferrals_total', 'counter',
+             'Syncs deferred due to system pressure', stats.deferrals)
+    prom.add('sync_deferred_seconds_total', 'counter',
+             'Time syncs were deferred due to system pressure',
+             stats.deferred_secs)
+    prom.add('sync_defer_expired_total', 'counter',
+             'Syncs run despite pressure as pressure_max_defer was reached',
+             stats.defer_expired)
+
+    inotify = sync.inotify
+    if inotify is not None:
+        for watch in inotify.watch_list:
+            labels = {'src': watch.sync_item.rsync_item.src}
+            prom.add('inotify_events_total', 'counter', 'Inotify events seen',
+                     watch.num_events, labels)
+            prom.add('inotify_events_excluded_total', 'counter',
+                     'Inotify events ignored - path excluded from sync',
+                     watch.num_excluded, labels)
+            prom.add('inotify_overflows_total', 'counter',
+                     'Times inotify events were lost', watch.num_overflows,
+                     labels)
+            prom.add('inotify_watch_active', 'gauge', 'Watch is active',
+                     watch.active, labels)
+
+    for item in sync.sync_items:
+        src = item.rsync_item.src
+        prom.add('sync_pending', 'gauge', 'Item has a sync waiting to run',
+                 item.is_pending(), {'src': src})
+
+        latency = item.latency.summary()
+        for (quantile, key) in (('0.5', 'p50'), ('0.95', 'p95')):
+            prom.add('sync_latency_seconds', 'summary',
+                     'First unsynced change event to replica updated',
+                     latency[key], {'src': src, 'quantile': quantile})
+        prom.add('sync_latency_seconds_sum', 'summary', '',
+                 latency['sum'], {'src': src})
+        prom.add('sync_latency_seconds_count', 'summary', '',
+                 latency['count'], {'src': src})
+        prom.add('sync_latency_max_seconds', 'gauge',
+                 'Longest change event to replica updated', latency['max'],
+                 {'src': src})
+        prom.add('sync_latency_slo_breaches_total', 'counter',
+                 'Syncs which took longer than sync_latency_slo',
+                 latency['breaches'], {'src': src})
+
+        if item.cgroup is not None:
+            _cgroup_metrics(prom, item.cgroup.stats(), {'src': src})
+
+        for (dest, totals) in item.history.totals().items():
+            labels = {'src': src, 'dest': dest}
+            count = 0
+            for (num, bound) in enumerate(DURATION_BUCKETS):
+                count += totals.buckets[num]
+                prom.add('dest_sync_duration_seconds_bucket', 'histogram',
+                         'Time to sync one destination',
+                         count, labels | {'le': str(bound)})
+            count += totals.buckets[-1]
+            prom.add('dest_sync_duration_seconds_bucket', 'histogram', '',
+                     count, labels | {'le': '+Inf'})
+            prom.add('dest_sync_duration_seconds_sum', 'histogram', '',
+                     totals.duration_sum, labels)
+            prom.add('dest_sync_duration_seconds_count', 'histogram', '',
+                     count, labels)
+
+            prom.add('dest_bytes_sent_total', 'counter',
+                     'Bytes sent by rsync', totals.bytes_sent, labels)
+            prom.add('dest_files_transferred_total', 'counter',
+                     'Files transferred by rsync', totals.files_transferred,
+                     labels)
+            prom.add('dest_failures_total', 'counter', 'Failed rsyncs',
+                     totals.failures, labels)
+            prom.add('dest_last_success_timestamp_seconds', 'gauge',
+                     'When last successful sync finished',
+                     totals.last_success, labels)
+
+    return prom.text()
+
+
+def _cgroup_metrics(prom: _PromText, stats: dict[str, int],
+                    labels: dict[str, str]):
+    """
+    Usage and throttling of an item's rsync cgroup (see cgroup::Cgroup)
+    """
+    prom.add('cgroup_cpu_seconds_total', 'counter',
+             'CPU used by rsync in item cgroup', stats['cpu_usec'] / 1e6,
+             labels)
+    prom.add('cgroup_cpu_throttled_seconds_total', 'counter',
+             'Time rsync was held back by cpu.max',
+             stats['cpu_throttled_usec'] / 1e6, labels)
+    prom.add('cgroup_io_stall_seconds_total', 'counter',
+             'Time rsync waited on io (io.pressure some)',
+             stats['io_stall_usec'] / 1e6, labels)
+    prom.add('cgroup_io_read_bytes_total', 'counter',
+             'Bytes read by rsync in item cgroup', stats['io_rbytes'], labels)
+    prom.add('cgroup_io_written_bytes_total', 'counter',
+             'Bytes written by rsync in item cgroup', stats['io_wbytes'],
+             labels)
+
+
+def write_atomic(path: str, text: str) -> bool:
+    """
+    Write file via temporary file + rename.
+    """
+    dirname = os.path.dirname(path) or '.'
+    tmp_path = ''
+    try:
+        (fd, tmp_path) = tempfile.mkstemp(
+                dir=dirname, prefix=f'.{os.path.basename(path)}.')
+        with os.fdopen(fd, 'w', encoding='utf-8') as fobj:
+            fobj.write(text)
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+
+    except OSError as err:
+        print(f'Failed to write metrics {path}: {err}')
+        if tmp_path:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+        return False
+    return True
+
+
+class MetricsWriter:
+    """
+    Writes metrics file every interval seconds (in its own thread).
+
+    Args:
+        path (str):
+            The .prom file.
+
+        sync (Sync):
+            What to report on.
+
+        interval (float):
+            Seconds between writes.
+    """
+    def __init__(self, path: str, sync: 'Sync', interval: float = 30):
+        self.path: str = path
+        self.sync: 'Sync' = sync
+        self.interval: float = max(1.0, interval)
+
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def write(self) -> bool:
+        """ Write metrics now """
+        return write_atomic(self.path, metrics_text(self.sync))
+
+    def _run(self):
+        """ thread """
+        while not self._stop.is_set():
+            start = time.monotonic()
+            self.write()
+            elapsed = time.monotonic() - start
+            self._stop.wait(max(0, self.interval - elapsed))
+
+    def start(self):
+        """ Start writing """
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='dual-root-metrics', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stop - metrics are written one last time """
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join()
+        self._thread = None
+        self.write()
@@ -0,0 +1,50 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - mount using the mount(2) system call.
+
+Avoids running /usr/bin/mount, which matters on the boot path,
+and gives the exact errno when it fails.
+"""
+import ctypes
+import os
+
+from ._libc import libc, errno_error
+
+# <sys/mount.h>
+MS_BIND = 0x1000
+MS_REC = 0x4000
+
+
+def mount_bind(src_dir: str, dest_dir: str, recursive: bool = False):
+    """
+    Bind mount src_dir onto dest_dir.
+
+    Args:
+        src_dir (str):
+            Directory to be bind mounted.
+
+        dest_dir (str):
+            Mount point.
+
+        recursive (bool):
+            Include any mounts under src_dir (mount --rbind).
+
+    Raises:
+        OSError with errno of the failed mount(2) or if libc
+        is not available.
+    """
+    c_lib = libc()
+    c_mount = c_lib.mount
+    c_mount.argtypes = [ctypes.c_char_p, ctypes.c_char_p, ctypes.c_char_p,
+                        ctypes.c_ulong, ctypes.c_void_p]
+    c_mount.restype = ctypes.c_int
+
+    flags = MS_BIND
+    if recursive:
+        flags |= MS_REC
+
+    ret = c_mount(os.fsencode(src_dir), os.fsencode(dest_dir), None,
+                  flags, None)
+    if ret != 0:
+        raise errno_error(f'mount {src_dir} -> {dest_dir}')
@@ -0,0 +1,109 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - system pressure (PSI).
+
+Reads /proc/pressure/{io,cpu,memory}:
+    some avg10=1.23 avg60=0.50 avg300=0.10 total=12345
+    full avg10=0.00 avg60=0.00 avg300=0.00 total=0
+
+The "some avg10" value is the percent of the last 10 seconds
+in which at least one task was stalled waiting on that resource.
+
+Used by the scheduler to hold off syncs while the machine is busy.
+"""
+import threading
+import time
+
+PRESSURE_DIR = '/proc/pressure'
+RESOURCES = ('io', 'cpu', 'memory')
+
+
+def read_pressure(resource: str,
+                  pressure_dir: str = PRESSURE_DIR) -> float | None:
+    """
+    "some avg10" of resource.
+
+    Returns:
+        float | None:
+        None if not available (kernel without PSI).
+    """
+    try:
+        with open(f'{pressure_dir}/{resource}', 'r',
+                  encoding='utf-8') as fobj:
+            line = fobj.readline()
+    except OSError:
+        return None
+
+    for field in line.split()[1:]:
+        (key, _sep, val) = field.partition('=')
+        if key == 'avg10':
+            try:
+                return float(val)
+            except ValueError:
+                return None
+    return None
+
+
+class PressureGate:
+    """
+    Is the system under too much pressure to sync now.
+
+    Args:
+        thresholds (dict[str, float]):
+            resource -> "some avg10" percent above which it is too busy.
+            Resource with 0 (or missing) is not checked.
+
+        cache_secs (float):
+            Reuse readings for this long.
+
+        pressure_dir (str):
+            Where to read from.
+    """
+    def __init__(self, thresholds: dict[str, float],
+                 cache_secs: float = 1.0,
+                 pressure_dir: str = PRESSURE_DIR):
+        self.thresholds: dict[str, float] = {
+                res: val for (res, val) in thresholds.items()
+                if res in RESOURCES and val > 0}
+        self.cache_secs: float = cache_secs
+        self.pressure_dir: str = pressure_dir
+
+        self._lock = threading.Lock()
+        self._read_time: float = 0
+        self._busy: list[str] = []
+
+    def enabled(self) -> bool:
+        """ True if any resource is checked """
+        return bool(self.thresholds)
+
+    def stale(self) -> bool:
+        """ True if busy() would read the pressure files """
+        if not self.thresholds:
+            return False
+        with self._lock:
+            return time.monotonic() - self._read_time >= self.cache_secs
+
+    def last(self) -> list[str]:
+        """ Resources above their threshold at last reading (no file reads) """
+        with self._lock:
+            return list(self._busy)
+
+    def busy(self) -> list[str]:
+        """
+        Resources currently above their threshold.
+        """
+        if not self.thresholds:
+            return []
+
+        now = time.monotonic()
+        with self._lock:
+            if now - self._read_time >= self.cache_secs:
+                busy: list[str] = []
+                for (res, limit) in self.thresholds.items():
+                    val = read_pressure(res, self.pressure_dir)
+                    if val is not None and val > limit:
+                        busy.append(res)
+                self._busy = busy
+                self._read_time = now
+            return list(self._busy)
@@ -1,12 +1,62 @@
-# SPDX-License-Identifier: MIT
+# SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com
 """
 Set process priority
+
+ - nice uses os.setpriority()
+ - ionice uses the ioprio_set system call (no libc wrapper exists)
+ - On Linux both are per thread and inherited by processes the
+   thread starts (see Prio.for_thread())
 """
 # pylint: disable=too-few-public-methods
-import psutil
-from psutil import (IOPRIO_CLASS_NONE, IOPRIO_CLASS_RT, IOPRIO_CLASS_BE)
-from psutil import (IOPRIO_CLASS_IDLE)
+from collections.abc import (Iterator)
+from contextlib import contextmanager
+import ctypes
+import os
+import platform
+
+from ._libc import libc, errno_error
+
+IOPRIO_CLASS_NONE = 0
+IOPRIO_CLASS_RT = 1
+IOPRIO_CLASS_BE = 2
+IOPRIO_CLASS_IDLE = 3
+
+_IOPRIO_CLASS_SHIFT = 13
+_IOPRIO_WHO_PROCESS = 1
+
+#
+# ioprio_set / ioprio_get syscall numbers by machine
+#
+_NR_IOPRIO_SET = {
+        'x86_64': 251,
+        'i386': 289,
+        'i686': 289,
+        'aarch64': 30,
+        'arm64': 30,
+        'riscv64': 30,
+        'loongarch64': 30,
+        'armv7l': 314,
+        'armv6l': 314,
+        'ppc64le': 273,
+        'ppc64': 273,
+        's390x': 282,
+        }
+
+_NR_IOPRIO_GET = {
+        'x86_64': 252,
+        'i386': 290,
+        'i686': 290,
+        'aarch64': 31,
+        'arm64': 31,
+        'riscv64': 31,
+        'loongarch64': 31,
+        'armv7l': 315,
+        'armv6l': 315,
+        'ppc64le': 274,
+        'ppc64': 274,
+        's390x': 283,
+        }
 
 
 class Prio:
@@ -25,48 +75,62 @@ class Prio:
 
         self._check_values()
 
-    def set_prio(self, pid: int = -1):
+    def set_prio(self, pid: int = -1) -> bool:
         """
         Set the current values
-        """
-        if pid > 1:
-            proc = psutil.Process(pid=pid)
-        else:
-            proc = psutil.Process()
 
-        args = self._ionice_args()
-        try:
-            proc.nice(self.nice)
-            proc.ionice(**args)
-        except psutil.Error:
-            pass
+        Args:
+            pid (int):
+                Process to change.
+                Default is this process (the calling thread).
 
-    def _ionice_args(self):
+        Returns:
+            bool: True if both nice and ionice were set.
         """
-        return dictionary psutil.ionice args
-         - map ionice_class to enum
-         {ioclass=None, value=None)
-        """
-        ionice_arg = {}
-        match self.ionice_class:
-            case 0:
-                ionice_arg = {'ioclass': IOPRIO_CLASS_NONE}
+        if pid <= 1:
+            pid = 0
+
+        okay = True
+        try:
+            os.setpriority(os.PRIO_PROCESS, pid, self.nice)
+        except OSError:
+            okay = False
 
-            case 1:
-                ionice_arg = {'ioclass': IOPRIO_CLASS_RT,
-                              'value:': self.ionice_level}
+        try:
+            ioprio_set(pid, self.ionice_class, self.ionice_level)
+        except OSError:
+            okay = False
 
-            case 2:
-                ionice_arg = {'ioclass': IOPRIO_CLASS_BE,
-                              'value':  self.ionice_level}
+        return okay
 
-            case 3:
-                ionice_arg = {'ioclass': IOPRIO_CLASS_IDLE}
+    @contextmanager
+    def for_thread(self) -> Iterator[None]:
+        """
+        Calling thread runs at these values, restored after.
 
-            case _:
-                ionice_arg = {'ioclass': IOPRIO_CLASS_NONE}
+        Processes started meanwhile (e.g. rsync) inherit them from
+        the start, without running anything in the forked child.
+        Left unchanged if current values cannot be read.
+        """
+        saved: tuple[int, int] | None = None
+        try:
+            saved = (os.getpriority(os.PRIO_PROCESS, 0), ioprio_get(0))
+        except OSError:
+            pass
 
-        return ionice_arg
+        if saved is not None:
+            self.set_prio()
+        try:
+            yield
+        finally:
+            if saved is not None:
+                (nice, ioprio) = saved
+                try:
+                    os.setpriority(os.PRIO_PROCESS, 0, nice)
+                    _ioprio_syscall(_NR_IOPRIO_SET, _IOPRIO_WHO_PROCESS, 0,
+                                    ioprio)
+                except OSError:
+                    pass
 
     def _check_values(self):
         """
@@ -78,6 +142,48 @@ class Prio:
         self.ionice_level = _range_limit(self.ionice_level, 0, 7)
 
 
+def ioprio_set(pid: int, ionice_class: int, ionice_level: int):
+    """
+    Set io scheduling class and level of process pid (0 = self).
+     - level only applies to realtime and best-effort classes
+
+    Raises:
+        OSError on failure or if syscall number unknown for this machine.
+    """
+    if ionice_class not in (IOPRIO_CLASS_RT, IOPRIO_CLASS_BE):
+        ionice_level = 0
+    ioprio = (ionice_class << _IOPRIO_CLASS_SHIFT) | ionice_level
+
+    _ioprio_syscall(_NR_IOPRIO_SET, _IOPRIO_WHO_PROCESS, pid, ioprio)
+
+
+def ioprio_get(pid: int) -> int:
+    """
+    Io scheduling class and level of process pid (0 = self)
+    as the raw value used by ioprio_set.
+
+    Raises:
+        OSError on failure or if syscall number unknown for this machine.
+    """
+    return _ioprio_syscall(_NR_IOPRIO_GET, _IOPRIO_WHO_PROCESS, pid)
+
+
+def _ioprio_syscall(nrs: dict[str, int], *args: int) -> int:
+    """
+    Make ioprio_set / ioprio_get system call (nrs by machine).
+    """
+    name = 'ioprio_set' if nrs is _NR_IOPRIO_SET else 'ioprio_get'
+    nr_syscall = nrs.get(platform.machine())
+    if nr_syscall is None:
+        raise OSError(f'{name} unknown on {platform.machine()}')
+
+    ret = libc().syscall(ctypes.c_long(nr_syscall),
+                         *[ctypes.c_int(arg) for arg in args])
+    if ret < 0:
+        raise errno_error(f'{name} pid {args[1]}')
+    return ret
+
+
 def _range_limit(value: int, low: int, high: int) -> int:
     """
     Limits integer number to fall in the specified range.
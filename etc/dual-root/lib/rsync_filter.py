@@ -0,0 +1,207 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - rsync exclude patterns, compiled for the event layer.
+
+Changes in excluded paths are never copied by rsync, so there is no
+point watching them or syncing because of them. Each item's exclude
+list (plus the ones always used, see rsync_tools) is compiled once
+into regular expressions which follow rsync's rules:
+
+ - "/" at start anchors to the top of the transfer, otherwise the
+   pattern may match at any directory level (end of path).
+ - "/" at end matches directories only.
+ - "dir/***" matches dir and everything in it.
+ - Pattern with "/" or "**" matches against the whole path, otherwise
+   only against the last component.
+ - "*" any chars except "/", "**" any chars, "?" one char except "/",
+   "[...]" a character class, backslash quotes the next char.
+ - Anything inside an excluded directory is excluded as well.
+
+Paths are matched relative to the transfer top, e.g. for source
+"/efi0/" the path "/efi0/EFI/x" is "EFI/x", for "/etc" it is "etc/...".
+"""
+import re
+
+from .rsync_tools import (DEFAULT_EXCLUDES, src_base)
+
+# chars with special meaning in POSIX extended regex
+_ERE_SPECIAL = set('.[]()*+?{}|^$\\')
+
+
+def _class_end(pat: str, start: int) -> int:
+    """
+    Index of "]" closing class starting at start ("["), -1 if none.
+    A "]" right after "[" or "[!" / "[^" is part of the class.
+    """
+    idx = start + 1
+    if idx < len(pat) and pat[idx] in '!^':
+        idx += 1
+    if idx < len(pat) and pat[idx] == ']':
+        idx += 1
+    return pat.find(']', idx)
+
+
+def _glob_to_re(pat: str, ere: bool = False) -> str:
+    """
+    rsync wildcard pattern to python (or POSIX extended) regex.
+    """
+    def literal(char: str) -> str:
+        if ere:
+            return '\\' + char if char in _ERE_SPECIAL else char
+        return re.escape(char)
+
+    out: list[str] = []
+    idx = 0
+    end = len(pat)
+    while idx < end:
+        char = pat[idx]
+        if char == '*':
+            if pat.startswith('**', idx):
+                out.append('.*')
+                idx += 2
+            else:
+                out.append('[^/]*')
+                idx += 1
+            continue
+
+        if char == '?':
+            out.append('[^/]')
+
+        elif char == '[':
+            close = _class_end(pat, idx)
+            if close < 0:
+                out.append(literal(char))
+            else:
+                body = pat[idx + 1:close]
+                if body[:1] in ('!', '^'):
+                    body = '^' + body[1:]
+                if not ere:
+                    body = body.replace('\\', '\\\\')
+                out.append(f'[{body}]')
+                idx = close
+
+        elif char == '\\' and idx + 1 < end:
+            idx += 1
+            out.append(literal(pat[idx]))
+
+        else:
+            out.append(literal(char))
+        idx += 1
+
+    return ''.join(out)
+
+
+class _Pattern:
+    """
+    One exclude pattern split into its parts.
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, pattern: str):
+        pat = pattern
+
+        # dir/*** : the dir and all below
+        self.with_dir: bool = False
+        if pat.endswith('/***'):
+            self.with_dir = True
+            pat = pat[:-4]
+
+        self.dir_only: bool = False
+        if pat.endswith('/') and not self.with_dir:
+            self.dir_only = True
+            pat = pat.rstrip('/')
+
+        self.anchored: bool = pat.startswith('/')
+        self.pat: str = pat.lstrip('/')
+
+
+class RsyncFilter:
+    """
+    Matches paths against the exclude patterns of one rsync source.
+
+    Args:
+        src (str):
+            rsync source (trailing "/" matters as for rsync).
+
+        patterns (list[str]):
+            Exclude patterns (as given to rsync --exclude).
+            The ones rsync is always run with are added.
+    """
+    def __init__(self, src: str, patterns: list[str]):
+        (base, _prefix) = src_base(src)
+        self.base: str = base
+        self.patterns: list[str] = list(DEFAULT_EXCLUDES) + [
+                pat for pat in patterns if pat and pat.strip('/')]
+
+        below: list[str] = []
+        exact_any: list[str] = []
+        exact_dir: list[str] = []
+        for pattern in self.patterns:
+            part = _Pattern(pattern)
+            start = r'\A' if part.anchored else r'(?:\A|/)'
+            rex = start + _glob_to_re(part.pat)
+            below.append(rex + '/')
+            exact_dir.append(rex + r'\Z')
+            if not part.dir_only:
+                exact_any.append(rex + r'\Z')
+
+        self._below = _compile(below)
+        self._exact_any = _compile(exact_any)
+        self._exact_dir = _compile(exact_dir)
+
+    def _rel(self, path: str) -> str | None:
+        """ path relative to transfer top - None if not under it """
+        base = self.base
+        if path.startswith(base):
+            return path[len(base):]
+        if path + '/' == base:
+            return ''
+        return None
+
+    def excluded(self, path: str, is_dir: bool = False) -> bool:
+        """
+        True if rsync would not copy path (absolute).
+        """
+        rel = self._rel(path)
+        if not rel:
+            return False
+
+        if self._below is not None and self._below.search(rel):
+            return True
+
+        exact = self._exact_dir if is_dir else self._exact_any
+        return exact is not None and exact.search(rel) is not None
+
+    def excluded_dir(self, path: str) -> bool:
+        """
+        True if directory path is excluded - no need to watch it.
+        """
+        return self.excluded(path, is_dir=True)
+
+    def inotifywait_regex(self) -> str:
+        """
+        POSIX extended regex for inotifywait --exclude (matched against
+        the full path). Only excludes what lies inside excluded
+        directories or matches a pattern for any file type, the rest
+        is left to excluded().
+        """
+        top = ''.join('\\' + char if char in _ERE_SPECIAL else char
+                      for char in self.base)
+
+        alts: list[str] = []
+        for pattern in self.patterns:
+            part = _Pattern(pattern)
+            start = '^' + top + ('' if part.anchored else '(.*/)?')
+            rex = start + _glob_to_re(part.pat, ere=True)
+            if part.dir_only:
+                alts.append(rex + '/')
+            else:
+                alts.append(rex + '(/|$)')
+        return '|'.join(alts)
+
+
+def _compile(alts: list[str]) -> re.Pattern | None:
+    """ one regex for all - None if nothing to match """
+    if not alts:
+        return None
+    return re.compile('|'.join(f'(?:{alt})' for alt in alts))
@@ -0,0 +1,258 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - what each rsync did.
+
+rsync is run with --stats and --itemize-changes and its output
+parsed as it arrives (see run_prog on_line) into a SyncResult.
+
+--stats (numbers may have "," separators):
+    Number of files: 1,234 (reg: 1,000, dir: 234)
+    Number of created files: 5 (reg: 5)
+    Number of deleted files: 0
+    Number of regular files transferred: 5
+    Total file size: 123,456 bytes
+    Total transferred file size: 12,345 bytes
+    Literal data: 12,345 bytes
+    Matched data: 0 bytes
+    File list generation time: 0.001 seconds
+    File list transfer time: 0.000 seconds
+    Total bytes sent: 13,000
+    Total bytes received: 100
+
+--itemize-changes, one line per item: YXcstpoguax path
+    Y: < sent, > received, c created, h hard link, . no transfer,
+       * message (e.g. "*deleting")
+"""
+# pylint: disable=too-many-instance-attributes
+from collections import deque
+import copy
+import threading
+import time
+
+# --stats label -> SyncResult attribute
+_STATS_KEYS = {
+        'Number of files': 'files_total',
+        'Number of created files': 'files_created',
+        'Number of deleted files': 'files_deleted',
+        'Number of regular files transferred': 'files_transferred',
+        'Total file size': 'total_size',
+        'Total transferred file size': 'transferred_size',
+        'Literal data': 'literal_bytes',
+        'Matched data': 'matched_bytes',
+        'File list generation time': 'file_list_gen_secs',
+        'File list transfer time': 'file_list_xfer_secs',
+        'Total bytes sent': 'bytes_sent',
+        'Total bytes received': 'bytes_received',
+        }
+
+
+class SyncResult:
+    """
+    Result of one rsync of a source to one destination.
+    """
+    def __init__(self, src: str, dest: str):
+        self.src: str = src
+        self.dest: str = dest
+        self.okay: bool = False
+        self.retc: int = -1
+
+        # wall clock (time.time()) start and seconds taken
+        self.start: float = time.time()
+        self.duration: float = 0
+
+        # from --stats
+        self.files_total: int = 0
+        self.files_created: int = 0
+        self.files_deleted: int = 0
+        self.files_transferred: int = 0
+        self.total_size: int = 0
+        self.transferred_size: int = 0
+        self.literal_bytes: int = 0
+        self.matched_bytes: int = 0
+        self.bytes_sent: int = 0
+        self.bytes_received: int = 0
+        self.file_list_gen_secs: float = 0
+        self.file_list_xfer_secs: float = 0
+
+        # from --itemize-changes
+        self.items_changed: int = 0
+        self.items_deleted: int = 0
+
+    @property
+    def transfer_secs(self) -> float:
+        """ time after building/sending file list """
+        list_secs = self.file_list_gen_secs + self.file_list_xfer_secs
+        return max(0, self.duration - list_secs)
+
+    def done(self, retc: int):
+        """
+        rsync finished
+        """
+        self.retc = retc
+        self.okay = retc == 0
+        self.duration = time.time() - self.start
+
+    def as_dict(self) -> dict[str, str | int | float | bool]:
+        """ for reporting """
+        info = dict(vars(self))
+        info['transfer_secs'] = self.transfer_secs
+        return info
+
+
+class RsyncOutputParser:
+    """
+    Fill in a SyncResult from rsync output lines.
+
+    Args:
+        result (SyncResult):
+            What to fill in.
+
+        echo (bool):
+            Print lines which are not stats (test mode).
+    """
+    # pylint: disable=too-few-public-methods
+    def __init__(self, result: SyncResult, echo: bool = False):
+        self.result: SyncResult = result
+        self.echo: bool = echo
+
+    def line(self, line: str):
+        """
+        One line of rsync output
+        """
+        if _parse_stats_line(self.result, line):
+            return
+
+        if _parse_item_line(self.result, line) and not self.echo:
+            return
+
+        if self.echo and line:
+            print(line)
+
+
+def _parse_stats_line(result: SyncResult, line: str) -> bool:
+    """
+    --stats line.
+
+    Returns:
+        bool: True if it was one.
+    """
+    (label, sep, rest) = line.partition(': ')
+    if not sep:
+        return False
+
+    attr = _STATS_KEYS.get(label.strip())
+    if attr is None:
+        return False
+
+    words = rest.split()
+    if not words:
+        return True
+    value = words[0].replace(',', '')
+    try:
+        if attr.endswith('_secs'):
+            setattr(result, attr, float(value))
+        else:
+            setattr(result, attr, int(float(value)))
+    except ValueError:
+        pass
+    return True
+
+
+def _parse_item_line(result: SyncResult, line: str) -> bool:
+    """
+    --itemize-changes line.
+
+    Returns:
+        bool: True if it was one.
+    """
+    if line.startswith('*deleting'):
+        result.items_deleted += 1
+        return True
+
+    if len(line) > 12 and line[11] == ' ' and line[0] in '<>ch.':
+        if line[0] != '.' or line[2:11].strip('.'):
+            result.items_changed += 1
+        return True
+    return False
+
+
+# upper bounds (secs) of sync duration histogram buckets
+DURATION_BUCKETS = (0.1, 0.5, 1, 5, 10, 30, 60, 300, 900, 3600)
+
+
+class DestTotals:
+    """
+    Totals for one destination since start.
+    """
+    def __init__(self):
+        self.syncs: int = 0
+        self.failures: int = 0
+        self.bytes_sent: int = 0
+        self.files_transferred: int = 0
+        self.last_success: float = 0
+
+        # duration histogram of successful syncs:
+        # count per bucket (last is +Inf) and sum
+        self.buckets: list[int] = [0] * (len(DURATION_BUCKETS) + 1)
+        self.duration_sum: float = 0
+
+    def add(self, result: SyncResult):
+        """ Count result """
+        self.syncs += 1
+        if not result.okay:
+            self.failures += 1
+            return
+
+        self.last_success = result.start + result.duration
+        self.bytes_sent += result.bytes_sent
+        self.files_transferred += result.files_transferred
+
+        self.duration_sum += result.duration
+        idx = len(DURATION_BUCKETS)
+        for (num, bound) in enumerate(DURATION_BUCKETS):
+            if result.duration <= bound:
+                idx = num
+                break
+        self.buckets[idx] += 1
+
+
+class SyncHistory:
+    """
+    Most recent SyncResults (rolling) and totals per destination.
+
+    Args:
+        size (int):
+            Number of results kept.
+    """
+    def __init__(self, size: int = 100):
+        self._lock = threading.Lock()
+        self._results: deque[SyncResult] = deque(maxlen=size)
+        self._last: dict[str, SyncResult] = {}
+        self._totals: dict[str, DestTotals] = {}
+
+    def add(self, result: SyncResult):
+        """ Record result """
+        with self._lock:
+            self._results.append(result)
+            self._last[result.dest] = result
+            totals = self._totals.get(result.dest)
+            if totals is None:
+                totals = DestTotals()
+                self._totals[result.dest] = totals
+            totals.add(result)
+
+    def totals(self) -> dict[str, DestTotals]:
+        """ destination -> totals (copies) """
+        with self._lock:
+            return copy.deepcopy(self._totals)
+
+    def results(self) -> list[SyncResult]:
+        """ all kept results, oldest first """
+        with self._lock:
+            return list(self._results)
+
+    def last(self, dest: str) -> SyncResult | None:
+        """ most recent result for destination """
+        with self._lock:
+            return self._last.get(dest)
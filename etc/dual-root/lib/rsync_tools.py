@@ -0,0 +1,291 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - rsync support tools
+
+See sync::sync_one()
+"""
+# pylint: disable=too-many-arguments, too-many-positional-arguments
+from contextlib import nullcontext
+import os
+import tempfile
+import threading
+
+from .run_prog import (run_prog, CancelToken)
+from .prio import Prio
+from .cgroup import Cgroup
+from .utils import tool_path
+from .sync_fanout import fanout
+from .rsync_stats import (SyncResult, RsyncOutputParser)
+from .tracing import trace_span
+
+# bytes of rsync output kept (last ones) - enough for error messages
+RSYNC_MAX_OUTPUT = 65536
+
+# always excluded (in addition to those of each item)
+DEFAULT_EXCLUDES = ['/lost+found/']
+
+
+def src_base(src: str) -> tuple[str, str]:
+    """
+    Split rsync source into the base directory used for --files-from
+    and the prefix of source relative to that base.
+     - "/efi0/" copies contents of /efi0 : ("/efi0/", "")
+     - "/etc" copies /etc itself         : ("/", "etc")
+    """
+    if src.endswith('/'):
+        return (src, '')
+
+    (head, tail) = os.path.split(src)
+    if not head.endswith('/'):
+        head += '/'
+    return (head, tail)
+
+
+def files_from_list(src: str, paths: list[str]) -> str | None:
+    """
+    Map absolute dirty paths to --files-from list (NUL separated)
+    relative to the source base.
+
+    Returns:
+        str | None:
+        None if the list covers the whole source (use full sync).
+        Empty string if nothing in list is part of source.
+    """
+    (base, prefix) = src_base(src)
+    top = os.path.normpath(os.path.join(base, prefix))
+    below_top = top if top == '/' else top + '/'
+
+    rel_paths: list[str] = []
+    for path in paths:
+        path = os.path.normpath(path)
+        if path == top:
+            return None
+
+        # only what is in the source tree ("/etc" is not "/etcx")
+        if not path.startswith(below_top):
+            continue
+        rel_paths.append(os.path.relpath(path, base))
+
+    if not rel_paths:
+        return ''
+    return '\0'.join(rel_paths) + '\0'
+
+
+def rsync_cmd(rsync_item) -> list[str]:
+    """
+    rsync command and options for one RsyncItem
+     - a copy: rsync_opts may be shared by other items.
+    """
+    rsync_opts = list(rsync_item.rsync_opts)
+    for excl in DEFAULT_EXCLUDES + rsync_item.excl:
+        rsync_opts += [f'--exclude={excl}']
+
+    return [tool_path('rsync')] + rsync_opts
+
+
+def rsync_src_args(src: str, files_from: str | None) -> list[str]:
+    """
+    Source argument(s) for rsync.
+     - files_from None : whole of src
+     - else paths listed in files_from (read from stdin)
+    """
+    if files_from is None:
+        return [f'{src}']
+
+    (base, _prefix) = src_base(src)
+    return ['-r', '--from0', '--files-from=-', '--delete-missing-args', base]
+
+
+def rsync_read_batch_opts(src_args: list[str]) -> list[str]:
+    """
+    Options from src_args needed when applying a batch (--read-batch).
+     - A batch file only carries the options affecting the stream, so
+       those acting on the receiving side (e.g. --delete-missing-args)
+       must be given again (as rsync's own batch.sh does).
+     - The source and the list of files are not used.
+    """
+    return [arg for arg in src_args[:-1]
+            if arg not in ('--from0', '--files-from=-')]
+
+
+class RsyncRunner:
+    """
+    Runs rsync commands for one sync.
+
+    Each rsync is run with --stats and --itemize-changes and what it
+    did is kept in results (one SyncResult per rsync).
+
+    Args:
+        src (str):
+            Source being synced.
+
+        quiet (bool):
+            Dont print commands.
+
+        test (bool):
+            Test mode (-n -v) - output is shown as it arrives.
+
+        prio (Prio | None):
+            Priority of each rsync. Set on the calling thread while rsync
+            runs, so it inherits it from the start (see Prio.for_thread()).
+
+        cgroup (Cgroup | None):
+            cgroup each rsync runs in (see Cgroup.exec_in()).
+
+        timeout (float):
+            Seconds each rsync may take (0 = no limit).
+
+        cancel (CancelToken | None):
+            Stops any running rsync when cancelled.
+    """
+    # pylint: disable=too-few-public-methods, too-many-instance-attributes
+    def __init__(self, src: str, quiet: bool, test: bool = False,
+                 prio: Prio | None = None,
+                 cgroup: Cgroup | None = None,
+                 timeout: float = 0,
+                 cancel: CancelToken | None = None):
+        self.src: str = src
+        self.quiet: bool = quiet
+        self.test: bool = test
+        self.prio: Prio | None = prio
+        self.cgroup: Cgroup | None = cgroup
+        self.timeout: float = timeout
+        self.cancel: CancelToken | None = cancel
+
+        self.results: list[SyncResult] = []
+        self._lock = threading.Lock()
+
+    def run(self, pargs: list[str], files_from: str | None,
+            attempt: bool = False) -> bool:
+        """
+        Run one rsync.
+         - files_from (if any) is fed on stdin
+         - destination is last argument
+         - attempt: caller falls back to something else if this fails,
+           so a failure is not kept in results.
+
+        Returns:
+            bool: True if all went well.
+        """
+        if not self.quiet:
+            cmd = ' '.join(pargs)
+            print(cmd)
+
+        result = SyncResult(self.src, pargs[-1])
+        parser = RsyncOutputParser(result, echo=self.test)
+        pargs = pargs[:1] + ['--stats', '--itemize-changes'] + pargs[1:]
+        cmd_args = pargs
+        if self.cgroup is not None:
+            cmd_args = self.cgroup.exec_in(pargs)
+
+        timeout = self.timeout if self.timeout > 0 else None
+        prio = self.prio.for_thread() if self.prio else nullcontext()
+        with prio, trace_span('rsync', src=self.src, dest=result.dest,
+                              mode=_rsync_mode(pargs)) as span:
+            (retc, _out, err) = run_prog(cmd_args, input_str=files_from,
+                                         on_line=parser.line,
+                                         max_output=RSYNC_MAX_OUTPUT,
+                                         timeout=timeout, cancel=self.cancel)
+            result.done(retc)
+            span.set(retc=retc, bytes_sent=result.bytes_sent,
+                     files=result.files_transferred,
+                     file_list_secs=(result.file_list_gen_secs
+                                     + result.file_list_xfer_secs),
+                     transfer_secs=result.transfer_secs)
+        if retc != 0 and attempt:
+            return False
+
+        with self._lock:
+            self.results.append(result)
+
+        if retc != 0:
+            print(f'rsync failed: {" ".join(pargs[-2:])}')
+            print(err)
+            return False
+
+        return True
+
+
+def _rsync_mode(pargs: list[str]) -> str:
+    """ for tracing: write-batch, read-batch or normal """
+    for arg in pargs:
+        if arg.startswith('--write-batch='):
+            return 'write-batch'
+        if arg.startswith('--read-batch='):
+            return 'read-batch'
+    return 'normal'
+
+
+def rsync_dests(rsync: list[str],
+                src_args: list[str],
+                files_from: str | None,
+                dests: list[str],
+                runner: RsyncRunner,
+                workers: int = 4) -> tuple[bool, dict[str, float]]:
+    """
+    Sync src to each destination with its own rsync.
+     - destinations on different disks are synced concurrently.
+
+    Returns:
+        tuple[okay: bool, times: dict[str, float]]:
+        okay is True if all destinations are synced,
+        times has seconds taken for each destination.
+    """
+    def sync_dest(dest: str) -> bool:
+        pargs = rsync + src_args + [f'{dest}']
+        return runner.run(pargs, files_from)
+
+    return fanout(dests, sync_dest, workers, runner.quiet)
+
+
+def rsync_batch(rsync: list[str],
+                src_args: list[str],
+                files_from: str | None,
+                dests: list[str],
+                runner: RsyncRunner,
+                workers: int = 4) -> tuple[bool, dict[str, float]]:
+    """
+    Sync src to several destinations computing the changes only once.
+
+    First destination is synced normally while recording a batch file
+    (--write-batch). The batch is then applied to each of the other
+    destinations (--read-batch), which avoids scanning and comparing the
+    source again. This relies on the destinations being identical, if
+    applying the batch fails, fall back to normal rsync for that one.
+
+    The other destinations are updated concurrently (see rsync_dests()).
+
+    Returns:
+        tuple[okay: bool, times: dict[str, float]]:
+        okay is True if all destinations are synced,
+        times has seconds taken for each destination.
+    """
+    with tempfile.TemporaryDirectory(prefix='dual-root-') as tmpdir:
+        batch = os.path.join(tmpdir, 'batch')
+
+        first = dests[0]
+
+        def write_batch(dest: str) -> bool:
+            pargs = rsync + [f'--write-batch={batch}'] + src_args + [dest]
+            return runner.run(pargs, files_from)
+
+        (batch_okay, times) = fanout([first], write_batch, 1, runner.quiet)
+        read_opts = rsync_read_batch_opts(src_args)
+
+        def sync_dest(dest: str) -> bool:
+            if batch_okay:
+                pargs = (rsync + read_opts
+                         + [f'--read-batch={batch}', f'{dest}'])
+                if runner.run(pargs, None, attempt=True):
+                    return True
+                print(f'rsync batch differs for {dest} - using normal rsync')
+
+            pargs = rsync + src_args + [f'{dest}']
+            return runner.run(pargs, files_from)
+
+        (okay, more_times) = fanout(dests[1:], sync_dest, workers,
+                                    runner.quiet)
+
+    times.update(more_times)
+    return (okay and batch_okay, times)
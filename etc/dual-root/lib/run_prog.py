@@ -1,93 +1,191 @@
-# SPDX-License-Identifier: MIT
+# SPDX-License-Identifier: MIT
 # SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
 """
 External program execution
 """
 # pylint: disable=too-many-arguments, too-many-positional-arguments
 # pylint: disable=consider-using-with
-from typing import (IO)
+from typing import (IO, cast)
+from collections.abc import (Callable)
 import os
-import fcntl
-import io
-from select import select
+import selectors
+import signal
 import subprocess
 from subprocess import SubprocessError
+import threading
+import time
+
+from ._trace_hook import trace_span
+
+# bytes read from a pipe at a time
+_READ_SIZE = 65536
+
+
+class _OutBuffer:
+    """
+    Output of one pipe.
+
+     - Bytes are kept in a bytearray and decoded once at the end.
+     - If on_line is set, it is called with each line as it arrives.
+       Lines are split on raw bytes, so a multibyte character split
+       across reads is never broken.
+     - If max_keep > 0 only the last max_keep bytes are kept.
+    """
+    def __init__(self, on_line: Callable[[str], None] | None = None,
+                 max_keep: int = 0):
+        self.on_line: Callable[[str], None] | None = on_line
+        self.max_keep: int = max_keep
+        self.data: bytearray = bytearray()
+        self.partial: bytearray = bytearray()
+        self.dropped: int = 0
+
+    def add(self, chunk: bytes):
+        """
+        New data
+        """
+        self.data += chunk
+        if 0 < self.max_keep and 2 * self.max_keep < len(self.data):
+            # trim in bulk - keeps it linear
+            excess = len(self.data) - self.max_keep
+            del self.data[:excess]
+            self.dropped += excess
+
+        if self.on_line is not None:
+            self.partial += chunk
+            end = self.partial.rfind(b'\n')
+            if end >= 0:
+                lines = bytes(self.partial[:end])
+                del self.partial[:end + 1]
+                for line in lines.split(b'\n'):
+                    self.on_line(line.decode('utf-8', errors='ignore'))
+
+    def close(self):
+        """
+        No more data - flush any unterminated last line.
+        """
+        if self.on_line is not None and self.partial:
+            self.on_line(self.partial.decode('utf-8', errors='ignore'))
+            self.partial = bytearray()
+
+    def text(self) -> str:
+        """
+        Retained output as string
+        """
+        if 0 < self.max_keep < len(self.data):
+            self.dropped += len(self.data) - self.max_keep
+            del self.data[:len(self.data) - self.max_keep]
+        return self.data.decode('utf-8', errors='ignore')
+
+
+class CancelToken:
+    """
+    Cooperative cancellation of running programs.
+
+    One token may be shared by many run_prog() calls (e.g. all
+    running rsyncs). cancel() wakes up and stops all of them.
+    It uses a pipe so waiters see it at once in their selector.
+    """
+    def __init__(self):
+        self._event = threading.Event()
+        (self._rfd, self._wfd) = os.pipe2(os.O_NONBLOCK | os.O_CLOEXEC)
+
+    def fileno(self) -> int:
+        """ readable once cancelled """
+        return self._rfd
+
+    def cancel(self):
+        """
+        Cancel - anything using this token is stopped.
+        """
+        if self._event.is_set():
+            return
+        self._event.set()
+        try:
+            os.write(self._wfd, b'x')
+        except OSError:
+            pass
+
+    def is_cancelled(self) -> bool:
+        """ True once cancel() has been called """
+        return self._event.is_set()
+
+    def close(self):
+        """ release the pipe """
+        for fdesc in (self._rfd, self._wfd):
+            try:
+                os.close(fdesc)
+            except OSError:
+                pass
 
 
 class _ProcWaitInfo:
     """
     Little Data class used while waiting process to complete
+     - selector (epoll) for the pipes and any cancel token
     """
     # pylint: disable=too-many-instance-attributes
-    def __init__(self, proc: subprocess.Popen, bstring: bytes | None):
+    def __init__(self, proc: subprocess.Popen, bstring: bytes | None,
+                 out: _OutBuffer, err: _OutBuffer,
+                 cancel: CancelToken | None):
         self.proc: subprocess.Popen = proc
-        self.bstring: bytes | None = bstring
+        self.bstring: memoryview = memoryview(bstring or b'')
+
+        self.out: _OutBuffer = out
+        self.err: _OutBuffer = err
 
-        self.has_stdout: bool = True
-        self.has_stderr: bool = True
-        self.has_stdin: bool = bool(bstring)
-        self.data_pending: bool = True
+        self.selector = selectors.DefaultSelector()
+        self.num_pipes: int = 0
 
-        self.readlist: list[int | IO] = []
-        self.writelist: list[int | IO] = []
-        self.exceplist: list[int | IO] = []
+        if proc.stdin is not None:
+            if self.bstring:
+                self._register(proc.stdin, selectors.EVENT_WRITE, None)
+            else:
+                proc.stdin.close()
 
-        # init non-blocking
-        self.nonblock()
-        self.is_data_pending()
+        if proc.stdout is not None:
+            self._register(proc.stdout, selectors.EVENT_READ, out)
 
-    def is_data_pending(self):
-        """
-        Any more data
-        """
-        self.data_pending = bool(self.has_stdout
-                                 or self.has_stderr
-                                 or self.has_stdin)
+        if proc.stderr is not None:
+            self._register(proc.stderr, selectors.EVENT_READ, err)
 
-    def nonblock(self):
+        if cancel is not None:
+            self.selector.register(cancel, selectors.EVENT_READ, cancel)
+
+    def _register(self, pipe: IO, event: int, data):
         """
-        Mark IO channels non-blocking
+        Non-blocking and add to selector
         """
-        proc = self.proc
         try:
-            if proc.stdin:
-                fcntl.fcntl(proc.stdin, fcntl.F_SETFL, os.O_NONBLOCK)
-
-            if proc.stdout:
-                fcntl.fcntl(proc.stdout, fcntl.F_SETFL, os.O_NONBLOCK)
-
-            if proc.stderr:
-                fcntl.fcntl(proc.stderr, fcntl.F_SETFL, os.O_NONBLOCK)
-
+            os.set_blocking(pipe.fileno(), False)
         except OSError as err:
             # Should not happen. Cross fingers and keep going.
             print(f'Error setting NONBLOCK: {err}')
+        self.selector.register(pipe, event, data)
+        self.num_pipes += 1
 
-    def update_select_iolists(self):
+    def done_with(self, pipe: IO):
         """
-        Update read/write lists for select
+        Pipe finished (EOF or all input written)
         """
-        #
-        # Subprocess Read list
-        #
-        self.readlist = []
-        if self.has_stdout and self.proc.stdout:
-            self.readlist.append(self.proc.stdout)
-
-        if self.has_stderr and self.proc.stderr:
-            self.readlist.append(self.proc.stderr)
-
-        #
-        # Subprocess Write list
-        #
-        self.writelist = []
-        if self.has_stdin and self.proc.stdin:
-            self.writelist = [self.proc.stdin]
-
-        if not (self.readlist or self.writelist or self.exceplist):
-            self.data_pending = False
+        self.selector.unregister(pipe)
+        self.num_pipes -= 1
+        try:
+            pipe.close()
+        except OSError:
+            pass
 
-        # No subprocess exception list
+    def close(self):
+        """
+        Close selector and any of our pipe ends still open
+        """
+        self.selector.close()
+        proc = self.proc
+        for pipe in (proc.stdin, proc.stdout, proc.stderr):
+            if pipe is not None and not pipe.closed:
+                try:
+                    pipe.close()
+                except OSError:
+                    pass
 
 
 def run_prog(pargs: list[str],
@@ -97,6 +195,11 @@ def run_prog(pargs: list[str],
              env: dict[str, str] | None = None,
              test: bool = False,
              verb: bool = False,
+             on_line: Callable[[str], None] | None = None,
+             max_output: int = 0,
+             timeout: float | None = None,
+             cancel: CancelToken | None = None,
+             kill_grace: float = 5.0,
              ) -> tuple[int, str, str]:
     """
     Run external program using subprocess.
@@ -104,7 +207,7 @@ def run_prog(pargs: list[str],
     Take care to handle large outputs (default buffer size
     is 8k). This avoids possible hangs should IO buffer fill up.
 
-    non-blocking IO together with select() loop provides
+    non-blocking IO together with a selector (epoll) loop provides
     a robust methodology.
 
     Args:
@@ -131,14 +234,38 @@ def run_prog(pargs: list[str],
         verb (bool):
             Flag - only used with test == True - prints pargs.
 
+        on_line (Callable[[str], None] | None):
+            Optional - called with each line of stdout (without newline)
+            as it arrives. Lets caller process output as it goes.
+
+        max_output (int):
+            If > 0, at most this many bytes of stdout and of stderr
+            are kept and returned (the last ones). Memory use is then
+            bounded however much the program outputs.
+
+        timeout (float | None):
+            Optional - seconds the program may run in total.
+
+        cancel (CancelToken | None):
+            Optional - program is stopped when this is cancelled.
+
+        kill_grace (float):
+            When stopping (timeout or cancel) the process group gets
+            SIGTERM, followed by SIGKILL if still running after this
+            many seconds.
+
     Returns:
         tuple[retc: int, stdout: str, stderr: str]:
             retc is 0 when all is well.
             stdout is what the subprocess returns on it's stdout
             and stderr is what it's stderr return.
+            If stopped, retc is negative signal and stderr says why.
 
-    Note that any input string is written in it's entirety in one
-    shot to the subprocess. This should not be a problem.
+    Any input string is written as the subprocess is ready to
+    read it, so it may be larger than the pipe buffer.
+
+    With timeout or cancel the program runs in its own process group,
+    so any processes it starts (e.g. rsync's receiver) are stopped too.
     """
     if not pargs:
         return (0, '', '')
@@ -148,11 +275,14 @@ def run_prog(pargs: list[str],
             print(' '.join(pargs))
         return (0, '', '')
 
+    if cancel is not None and cancel.is_cancelled():
+        return (-1, '', 'cancelled')
+
     #
     # Tee up any input - even if no "input string"
     # If no input string and process expects input
     # it would hang without input - so we always allow it.
-    # Select() will tell us whether process needs it.
+    # The selector will tell us whether process needs it.
     #
     bstring: bytes | None = None
     stdin: int | None = None
@@ -161,13 +291,15 @@ def run_prog(pargs: list[str],
         stdin = subprocess.PIPE
 
     retc: int = -1
-    output: str = ''
-    errors: str = ''
+    own_group = timeout is not None or cancel is not None
 
     #
     # Start up the process
     #
-    (okay, proc, errors) = _popen_proc(pargs, stdin, stdout, stderr, env)
+    prog = os.path.basename(pargs[0]) if pargs else ''
+    with trace_span('spawn', prog=prog):
+        (okay, proc, errors) = _popen_proc(pargs, stdin, stdout, stderr, env,
+                                           own_group)
 
     if not okay:
         return (1, '', errors)
@@ -175,9 +307,18 @@ def run_prog(pargs: list[str],
     #
     # Wait for it to complete
     #
-    (retc, output, errors) = _wait_for_proc(bstring, proc)
+    deadline: float | None = None
+    if timeout is not None:
+        deadline = time.monotonic() + timeout
+
+    out = _OutBuffer(on_line, max_output)
+    err = _OutBuffer(None, max_output)
+    with trace_span('wait', prog=prog) as span:
+        retc = _wait_for_proc(bstring, proc, out, err, deadline, cancel,
+                              kill_grace)
+        span.set(pid=proc.pid if proc else -1, retc=retc)
 
-    return (retc, output, errors)
+    return (retc, out.text(), err.text())
 
 
 def _popen_proc(pargs: list[str],
@@ -185,18 +326,22 @@ def _popen_proc(pargs: list[str],
                 stdout: int = subprocess.PIPE,
                 stderr: int = subprocess.PIPE,
                 env: dict[str, str] | None = None,
+                own_group: bool = False,
                 ) -> tuple[bool, subprocess.Popen | None, str]:
     """
     Popen the process to run
 
     Handle large output buffers using non-blocking IO
-    together with select() and reading of buffers/pipes to ensure
+    together with a selector and reading of buffers/pipes to ensure
     they never fill up and block.
     Without this, larger output can hang when IO buffer is full.
 
     Args:
         See run_prog()
 
+        own_group (bool):
+            Start process in a new process group.
+
     Returns:
         tuple[success: bool, proc: subprocess.Popen , error: str]
     """
@@ -209,7 +354,8 @@ def _popen_proc(pargs: list[str],
                                 stdin=stdin,
                                 stdout=stdout,
                                 stderr=stderr,
-                                env=env)
+                                env=env,
+                                process_group=0 if own_group else None)
 
     except (OSError, FileNotFoundError, ValueError, SubprocessError) as err:
         return (False, proc, str(err))
@@ -218,7 +364,12 @@ def _popen_proc(pargs: list[str],
 
 
 def _wait_for_proc(bstring: bytes | None,
-                   proc: subprocess.Popen | None) -> tuple[int, str, str]:
+                   proc: subprocess.Popen | None,
+                   out: _OutBuffer,
+                   err: _OutBuffer,
+                   deadline: float | None = None,
+                   cancel: CancelToken | None = None,
+                   kill_grace: float = 5.0) -> int:
     """
     Process has been opened, wait for process to complete.
     Read/Write any data as may be needed.
@@ -226,115 +377,198 @@ def _wait_for_proc(bstring: bytes | None,
     Args:
         proc (subprocess.Popen):
 
-    Returns:
-        tuple[returncode: int, stdout: str, stderr: str]
-    """
-    output = ''
-    errors = ''
-    timeout = 30
+        out, err (_OutBuffer):
+            Where stdout and stderr go.
 
-    if not proc:
-        return (-1, '', 'process not started by popen - giving up')
+        deadline (float | None):
+            time.monotonic() by which it must be done.
+
+        cancel (CancelToken | None):
+            Stop if this is cancelled.
 
-    pwi = _ProcWaitInfo(proc, bstring)
-    returncode = proc.returncode
-    all_done: bool = False
+        kill_grace (float):
+            See run_prog()
 
-    while not all_done and (returncode is None or pwi.data_pending):
-        returncode = proc.poll()
-        pwi.update_select_iolists()
+    Returns:
+        int: returncode
+    """
+    if not proc:
+        err.add(b'process not started by popen - giving up')
+        return -1
 
-        if returncode:
-            #
-            # Process exited.
-            # Allow final data check for possible unread buffered data.
-            #
-            all_done = True
-            break
+    pwi = _ProcWaitInfo(proc, bstring, out, err, cancel)
 
-        if not pwi.data_pending:
-            continue
+    why_stop = ''
+    try:
+        while pwi.num_pipes > 0:
+            wait: float | None = None
+            if deadline is not None:
+                wait = deadline - time.monotonic()
+                if wait <= 0:
+                    why_stop = 'timed out'
+                    break
+
+            events = pwi.selector.select(wait)
+            if cancel is not None and cancel.is_cancelled():
+                why_stop = 'cancelled'
+                break
+
+            if not _handle_events(pwi, events):
+                # pipes unusable - dont wait on a process we cant read
+                why_stop = 'pipe error'
+                break
 
         #
-        # Handle data
-        # Note if all_done ignore fail as just checking.
+        # Pipes closed - process should be done (or about to be)
         #
-        (okay, this_output, this_errors) = _check_for_data(pwi, timeout)
-        output += this_output
-        errors += this_errors
-        pwi.is_data_pending()
+        if not why_stop:
+            why_stop = _wait_exit(proc, deadline, cancel)
+
+    finally:
+        out.close()
+        err.close()
+        pwi.close()
 
-        if not all_done and not okay:
-            return (-1, output, errors)
+    if why_stop:
+        err.add(f'{why_stop}: {_args_text(proc)}\n'.encode('utf-8'))
+        _stop_proc(proc, kill_grace, deadline is not None or bool(cancel))
 
-    # all done.
     retc = proc.returncode
     if retc is None:
         # should never happen
         retc = -1
 
-    return (retc, output, errors)
+    return retc
 
 
-def _check_for_data(pwi: _ProcWaitInfo, timeout: int) -> tuple[bool, str, str]:
+def _wait_exit(proc: subprocess.Popen, deadline: float | None,
+               cancel: CancelToken | None) -> str:
     """
-    Check if have any data.
+    Wait for process to exit.
 
-    Args:
-        pwi (_ProcWaitInfo):
-            The info needed to wait on any data
+    Returns:
+        str: '' once exited, else why we gave up waiting.
+    """
+    while True:
+        wait: float | None = None
+        if cancel is not None:
+            wait = 0.5
+        if deadline is not None:
+            left = max(0, deadline - time.monotonic())
+            wait = left if wait is None else min(wait, left)
+        try:
+            proc.wait(timeout=wait)
+            return ''
+        except subprocess.TimeoutExpired:
+            pass
 
-        timeout (int):
-            timeout seconds for select()
+        if cancel is not None and cancel.is_cancelled():
+            return 'cancelled'
+        if deadline is not None and time.monotonic() >= deadline:
+            return 'timed out'
+
+
+def _handle_events(pwi: _ProcWaitInfo,
+                   events: list[tuple[selectors.SelectorKey, int]]) -> bool:
+    """
+    Read/Write pipes which are ready.
 
     Returns:
-        tuple[success: bool, stdout: str, stderr: str]
+        bool: False on error (reported on stderr buffer).
     """
-    bufsiz = io.DEFAULT_BUFFER_SIZE
+    for (key, _mask) in events:
+        if isinstance(key.data, CancelToken):
+            continue
+
+        pipe = cast(IO, key.fileobj)
+        try:
+            if key.data is None:
+                # stdin
+                try:
+                    num = os.write(pipe.fileno(), pwi.bstring)
+                    pwi.bstring = pwi.bstring[num:]
+                except BlockingIOError:
+                    pass
+                except BrokenPipeError:
+                    # process not reading any more
+                    pwi.bstring = pwi.bstring[:0]
+
+                if not pwi.bstring:
+                    pwi.done_with(pipe)
+
+            elif not _read_pipe(pipe, key.data):
+                pwi.done_with(pipe)
+
+        except (OSError, ValueError) as exc:
+            # read/write
+            pwi.err.add(f'{exc}:\n'.encode('utf-8'))
+            return False
+
+    return True
 
-    proc: subprocess.Popen = pwi.proc
-    bstring: bytes | None = pwi.bstring
 
-    output: str = ''
-    errors: str = ''
+def _read_pipe(pipe: IO, buf: _OutBuffer) -> bool:
+    """
+    Read what is available from pipe into buf.
 
+    Returns:
+        bool: False once pipe is at EOF.
+    """
     try:
-        pwi.update_select_iolists()
-        ready = select(pwi.readlist, pwi.writelist, pwi.exceplist, timeout)
-        read_ready = ready[0]
-        write_ready = ready[1]
+        data = os.read(pipe.fileno(), _READ_SIZE)
+    except BlockingIOError:
+        return True
+
+    if not data:
+        return False
 
+    buf.add(data)
+    return True
+
+
+def _stop_proc(proc: subprocess.Popen, kill_grace: float, own_group: bool):
+    """
+    Stop process (and its process group if it has its own):
+    SIGTERM then SIGKILL if still running after kill_grace seconds.
+    """
+    if proc.poll() is None:
+        _kill(proc, signal.SIGTERM, own_group)
         try:
-            if pwi.has_stdin and proc.stdin and proc.stdin in write_ready:
-                proc.stdin.write(bstring)
-                proc.stdin.flush()
-                proc.stdin.close()
-                pwi.has_stdin = False
-
-            if pwi.has_stdout and proc.stdout and proc.stdout in read_ready:
-                data = proc.stdout.read(bufsiz)
-                if len(data) == 0:
-                    pwi.has_stdout = False
-                    proc.stdout.close()
-                else:
-                    output += str(data, 'utf-8', errors='ignore')
-
-            if pwi.has_stderr and proc.stderr and proc.stderr in read_ready:
-                data = proc.stderr.read(bufsiz)
-                if len(data) == 0:
-                    pwi.has_stderr = False
-                    proc.stderr.close()
-                else:
-                    errors += str(data, 'utf-8', errors='ignore')
-
-            pwi.is_data_pending()
-
-        except (OSError, IOError, EOFError, ValueError) as err:
-            # read/write
-            return (False, output, str(err) + ':\n' + errors)
+            proc.wait(timeout=kill_grace)
+        except subprocess.TimeoutExpired:
+            pass
+
+    # anything left in the group
+    _kill(proc, signal.SIGKILL, own_group)
+    try:
+        # stuck in uninterruptible io (failing disk) - dont hang with it
+        proc.wait(timeout=kill_grace)
+    except subprocess.TimeoutExpired:
+        print(f'Process {proc.pid} not exiting: {_args_text(proc)}')
+
 
-    except (OSError, ValueError) as err:
-        # select
-        return (False, output, str(err) + ':\n' + errors)
+def _args_text(proc: subprocess.Popen) -> str:
+    """ command line of proc for messages """
+    if isinstance(proc.args, (list, tuple)):
+        return ' '.join(str(arg) for arg in proc.args)
+    return str(proc.args)
 
-    return (True, output, errors)
+
+def _kill(proc: subprocess.Popen, sig: int, own_group: bool):
+    """
+    Send sig to process group led by proc if it has its own,
+    otherwise just to proc.
+    """
+    if own_group:
+        try:
+            os.killpg(proc.pid, sig)
+        except OSError:
+            # group is gone
+            pass
+        return
+
+    if proc.poll() is None:
+        try:
+            proc.send_signal(sig)
+        except OSError:
+            pass
@@ -4,8 +4,10 @@
   Dual Root Support Utils
 """
 import os
-from .run_prog import run_prog
 from .utils_block import mount_to_uuid
+from .rsync_tools import (files_from_list, rsync_cmd, rsync_src_args)
+from .rsync_tools import (rsync_dests, rsync_batch, RsyncRunner)
+from .tracing import trace_span
 
 
 def rsync_options_final(opts_in: list[str], test: bool = False) -> list[str]:
@@ -61,34 +63,99 @@ def rsync_options_final(opts_in: list[str], test: bool = False) -> list[str]:
     return rsync_opts
 
 
-def sync_one(sync_item, quiet):
+def sync_one(sync_item, quiet) -> bool:
     """
     Sync one SyncItem
      - source/dest/exclusionsitems use rsync notation
      - e.g. include trailing "/" if needed etc
      - rsync_opts_in is either None or list of options
+
+    Only the paths changed since last sync are copied (--files-from),
+    unless a full sync is needed (see SyncItem.dirty).
+
+    With more than one destination the changes are computed
+    once and applied to the others using rsync batch mode.
+    Destinations on different disks are synced concurrently.
+
+    If the item has its own priority (nice/ionice) it is applied
+    to each rsync process before it starts, so the processes rsync
+    forks get it too. If it has a cgroup each rsync is moved into it.
+
+    Each rsync is stopped if it takes longer than rsync_timeout
+    or the scheduler cancels running syncs (shutdown).
+
+    What each rsync did (see rsync_stats::SyncResult) is kept
+    in the item's history.
+
+    Returns:
+        bool: True if all went well.
+    """
+    with trace_span('sync', src=sync_item.rsync_item.src) as span:
+        okay = _sync_one(sync_item, quiet, span)
+        span.set(okay=okay)
+    return okay
+
+
+def _sync_one(sync_item, quiet, span) -> bool:
+    """
+    See sync_one()
     """
     rsync_item = sync_item.rsync_item
+    src = rsync_item.src
+    dests = rsync_item.dst
+
+    (full, paths) = sync_item.dirty.take()
+    span.set(full=full, paths=len(paths))
+
+    files_from: str | None = None
+    if not full:
+        files_from = files_from_list(src, paths)
+        if files_from == '':
+            # nothing changed that we copy
+            return True
+
+    rsync = rsync_cmd(rsync_item)
+    src_args = rsync_src_args(src, files_from)
+    test = sync_item.test
+
+    workers = sync_item.dest_workers
+    cgroup = sync_item.cgroup
+    runner = RsyncRunner(src, quiet, test, prio=sync_item.prio, cgroup=cgroup,
+                         timeout=sync_item.rsync_timeout,
+                         cancel=sync_item.scheduler.cancel)
+    stats_before = cgroup.stats() if cgroup is not None else {}
+
+    if sync_item.batch and len(dests) > 1 and not test:
+        (okay, times) = rsync_batch(rsync, src_args, files_from, dests,
+                                    runner, workers)
+    else:
+        (okay, times) = rsync_dests(rsync, src_args, files_from, dests,
+                                    runner, workers)
+    sync_item.dest_times = times
+    for result in runner.results:
+        sync_item.history.add(result)
 
-    rsync_opts = rsync_item.rsync_opts
-    rsync_opts += ['--exclude=/lost+found/']
-    for excl in rsync_item.excl:
-        rsync_opts += [f'--exclude={excl}']
+    if cgroup is not None:
+        _cgroup_stats(sync_item, stats_before, quiet)
 
-    rsync = ['/usr/bin/rsync'] + rsync_opts
+    if not okay:
+        sync_item.dirty.restore(full, paths)
+    return okay
 
-    for dest in rsync_item.dst:
-        pargs = rsync + [f'{rsync_item.src}', f'{dest}']
-        if not quiet:
-            cmd = ' '.join(pargs)
-            print(cmd)
 
-        (retc, out, err) = run_prog(pargs)
-        if retc != 0:
-            print(f'rsync failed: {rsync_item.src} -> {dest}')
-            print(err)
-        elif sync_item.test and out:
-            print(out)
+def _cgroup_stats(sync_item, before: dict[str, int], quiet: bool):
+    """
+    Record cgroup usage/throttling during this sync
+    """
+    after = sync_item.cgroup.stats()
+    delta = {key: val - before.get(key, 0) for (key, val) in after.items()}
+    sync_item.cgroup_stats = delta
+
+    if not quiet:
+        cpu_thr = delta['cpu_throttled_usec'] / 1e6
+        io_stall = delta['io_stall_usec'] / 1e6
+        print(f'  cgroup: cpu throttled {cpu_thr:.2f} secs,'
+              f' io stalled {io_stall:.2f} secs')
 
 
 def _check_sync_item(item, all_src, all_dst):
@@ -101,9 +168,9 @@ def _check_sync_item(item, all_src, all_dst):
      - input here lists - not SyncItems
     """
     # pylint: disable=R0911,R0912
-    if len(item) != 3:
+    if len(item) != 4:
         print(f'Malformed sync item {item}.')
-        print('Should be (src, dest_list, excl_list)')
+        print('Should be (src, dest_list, excl_list, opts)')
         return False
 
     src = item[0]
@@ -152,7 +219,7 @@ def _check_sync_item(item, all_src, all_dst):
 def check_sync_list(sync_list):
     """
     Sanity check sync list
-       sync_list has each element ~ [src, dst, excl]
+       sync_list has each element ~ [src, dst, excl, opts]
     """
 
     all_dest = []
@@ -0,0 +1,143 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - track what changed since last sync.
+
+Inotify events add the changed paths here. When a sync runs it takes
+the (collapsed) set of paths and rsync's only those, rather than the
+whole source tree.
+
+A full sync is requested when:
+ - nothing is known yet (first sync after start)
+ - events were lost (inotify queue overflow)
+ - too many paths have accumulated
+ - full_interval seconds have passed since the last full sync
+"""
+import threading
+import time
+
+# beyond this, a full tree sync is cheaper than a long file list
+MAX_DIRTY_PATHS = 2000
+
+
+class DirtyPaths:
+    """
+    Thread safe set of dirty paths for one sync item.
+
+    Args:
+        full_interval (float):
+            Seconds between periodic full syncs (0 to disable).
+    """
+    def __init__(self, full_interval: float = 86400):
+        self._lock = threading.Lock()
+
+        self.full: bool = True
+        self.full_interval: float = full_interval
+        self.last_full: float = -1
+
+        # path -> True if whole subtree is dirty
+        self.paths: dict[str, bool] = {}
+
+    def add(self, path: str, tree: bool = False):
+        """
+        Mark path as changed.
+
+        Args:
+            path (str):
+                Absolute path of what changed.
+
+            tree (bool):
+                If True everything below path is also dirty.
+                Used for directories created, deleted or moved.
+        """
+        with self._lock:
+            if self.full:
+                return
+
+            if tree or not self.paths.get(path, False):
+                self.paths[path] = tree
+
+            if len(self.paths) > MAX_DIRTY_PATHS:
+                self._set_full()
+
+    def mark_full(self):
+        """
+        Next sync must be a full one.
+        """
+        with self._lock:
+            self._set_full()
+
+    def _set_full(self):
+        """ lock held """
+        self.full = True
+        self.paths = {}
+
+    def is_dirty(self) -> bool:
+        """ anything to sync """
+        with self._lock:
+            return self.full or bool(self.paths)
+
+    def take(self, now: float | None = None) -> tuple[bool, list[str]]:
+        """
+        Take the current dirty set, leaving it empty.
+
+        Returns:
+            tuple[full: bool, paths: list[str]]:
+            If full is True do complete sync and paths is empty.
+            Otherwise paths is minimal list of paths to sync:
+            nothing in list is below a dirty subtree also in the list.
+        """
+        if now is None:
+            now = time.time()
+
+        with self._lock:
+            full = self.full
+            if (not full and self.full_interval > 0
+                    and now - self.last_full > self.full_interval):
+                full = True
+
+            paths: list[str] = []
+            if full:
+                self.last_full = now
+            else:
+                paths = _collapse(self.paths)
+
+            self.full = False
+            self.paths = {}
+
+        return (full, paths)
+
+    def restore(self, full: bool, paths: list[str]):
+        """
+        Put back what was taken - e.g. sync failed.
+        Paths are restored as subtrees, to be safe.
+        """
+        if full:
+            self.mark_full()
+            return
+
+        for path in paths:
+            self.add(path, tree=True)
+
+
+def _collapse(paths: dict[str, bool]) -> list[str]:
+    """
+    Minimal list of paths: drop anything covered by a dirty subtree.
+
+    Sorting places each directory immediately before its own
+    descendants (using '/' as terminator), so one pass is enough.
+    """
+    result: list[str] = []
+    tree_prefix = ''
+
+    for path in sorted(paths, key=lambda p: p.rstrip('/') + '/'):
+        if tree_prefix and (path + '/').startswith(tree_prefix):
+            continue
+
+        result.append(path)
+        if paths[path]:
+            tree_prefix = path.rstrip('/') + '/'
+        else:
+            tree_prefix = ''
+
+    return result
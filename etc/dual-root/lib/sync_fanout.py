@@ -0,0 +1,145 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - sync several destinations concurrently.
+
+Destinations on different disks are synced in parallel, using a
+bounded number of worker threads, while those sharing a disk are synced
+one after the other. Each disk also has a lock, so syncs from different
+sync items to the same disk do not run at the same time either.
+
+Worker threads are kept in one pool (per number of workers) for the
+life of the process, so a sync does not start any threads of its own.
+"""
+from collections.abc import (Callable)
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from .utils_block import path_to_disks
+
+_DISK_LOCKS: dict[str, threading.Lock] = {}
+_DISK_LOCKS_LOCK = threading.Lock()
+
+_POOLS: dict[int, ThreadPoolExecutor] = {}
+_POOLS_LOCK = threading.Lock()
+
+
+def _pool(workers: int) -> ThreadPoolExecutor:
+    """
+    Shared pool with workers threads - threads are started as needed
+    and then reused.
+    """
+    with _POOLS_LOCK:
+        pool = _POOLS.get(workers)
+        if pool is None:
+            pool = ThreadPoolExecutor(max_workers=workers,
+                                      thread_name_prefix='dual-root-dest')
+            _POOLS[workers] = pool
+    return pool
+
+
+def _disk_locks(disks: list[str]) -> list[threading.Lock]:
+    """
+    Locks for disks - always in the same (sorted) order to avoid deadlocks
+    """
+    locks: list[threading.Lock] = []
+    with _DISK_LOCKS_LOCK:
+        for disk in sorted(disks):
+            lock = _DISK_LOCKS.get(disk)
+            if lock is None:
+                lock = threading.Lock()
+                _DISK_LOCKS[disk] = lock
+            locks.append(lock)
+    return locks
+
+
+def group_by_disk(dests: list[str]) -> list[tuple[list[str], list[str]]]:
+    """
+    Group destinations sharing any disk.
+
+    Returns:
+        list[tuple[dests: list[str], disks: list[str]]]:
+        Each group of destinations and all disks they use.
+    """
+    groups: list[tuple[list[str], set[str]]] = []
+
+    for dest in dests:
+        disks = set(path_to_disks(dest))
+
+        merged_dests = [dest]
+        merged_disks = disks
+        keep: list[tuple[list[str], set[str]]] = []
+        for (group_dests, group_disks) in groups:
+            if group_disks & merged_disks:
+                merged_dests = group_dests + merged_dests
+                merged_disks = group_disks | merged_disks
+            else:
+                keep.append((group_dests, group_disks))
+
+        keep.append((merged_dests, merged_disks))
+        groups = keep
+
+    return [(group_dests, sorted(group_disks))
+            for (group_dests, group_disks) in groups]
+
+
+def fanout(dests: list[str],
+           sync_func: Callable[[str], bool],
+           workers: int = 4,
+           quiet: bool = False) -> tuple[bool, dict[str, float]]:
+    """
+    Run sync_func(dest) for each destination.
+
+    Args:
+        dests (list[str]):
+            Destinations.
+
+        sync_func (Callable[[str], bool]):
+            Syncs one destination - returns True if all went well.
+
+        workers (int):
+            Maximum number of destination groups synced at the same time
+            (shared by all callers using the same number).
+
+        quiet (bool):
+            If False print how long each destination took.
+
+    Returns:
+        tuple[okay: bool, times: dict[str, float]]:
+        okay is True if every destination synced and
+        times maps each destination to seconds it took.
+    """
+    times: dict[str, float] = {}
+    results: dict[str, bool] = {}
+
+    def sync_group(group: tuple[list[str], list[str]]):
+        (group_dests, disks) = group
+        locks = _disk_locks(disks)
+        for dest in group_dests:
+            for lock in locks:
+                lock.acquire()
+            try:
+                start = time.monotonic()
+                results[dest] = sync_func(dest)
+                times[dest] = time.monotonic() - start
+            finally:
+                for lock in reversed(locks):
+                    lock.release()
+
+    groups = group_by_disk(dests)
+    if workers <= 1 or len(groups) <= 1:
+        for group in groups:
+            sync_group(group)
+    else:
+        pool = _pool(workers)
+        for future in [pool.submit(sync_group, grp) for grp in groups]:
+            future.result()
+
+    if not quiet:
+        for dest in dests:
+            if dest in times:
+                print(f'  {dest}: {times[dest]:.2f} secs')
+
+    okay = all(results.get(dest, False) for dest in dests)
+    return (okay, times)
@@ -0,0 +1,91 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - event to replica latency.
+
+For each sync item, the time from the first change event not yet
+synced until the sync covering it has completed successfully.
+i.e. how long after a new kernel lands on /efi0 it is also on /efi1.
+
+This is what sync_delay and sync_max_latency trade off against the
+number of syncs run. If a service level objective (slo) is set,
+a warning is given each time latency exceeds it.
+"""
+from collections import deque
+import math
+import threading
+
+
+class SyncLatency:
+    """
+    Latency samples (seconds) for one sync item.
+
+    Args:
+        slo (float):
+            Warn if latency exceeds this many seconds (0 = no slo).
+
+        size (int):
+            Number of recent samples used for percentiles.
+    """
+    def __init__(self, slo: float = 0, size: int = 1000):
+        self._lock = threading.Lock()
+        self._samples: deque[float] = deque(maxlen=size)
+
+        self.slo: float = max(0, slo)
+
+        # since start
+        self.count: int = 0
+        self.total: float = 0
+        self.max: float = 0
+        self.breaches: int = 0
+
+    def add(self, latency: float) -> bool:
+        """
+        Record one latency.
+
+        Returns:
+            bool: False if slo was breached.
+        """
+        latency = max(0, latency)
+        breach = 0 < self.slo < latency
+        with self._lock:
+            self._samples.append(latency)
+            self.count += 1
+            self.total += latency
+            self.max = max(self.max, latency)
+            if breach:
+                self.breaches += 1
+        return not breach
+
+    def percentile(self, pct: float) -> float:
+        """
+        Percentile (0-100) of recent samples (nearest rank).
+        0 if no samples yet.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+        return _nearest_rank(samples, pct)
+
+    def summary(self) -> dict[str, float]:
+        """
+        count, sum, p50, p95, max (since start) and slo breaches.
+        """
+        with self._lock:
+            samples = sorted(self._samples)
+            info: dict[str, float] = {
+                    'count': self.count,
+                    'sum': self.total,
+                    'max': self.max,
+                    'breaches': self.breaches,
+                    }
+        info['p50'] = _nearest_rank(samples, 50)
+        info['p95'] = _nearest_rank(samples, 95)
+        return info
+
+
+def _nearest_rank(samples: list[float], pct: float) -> float:
+    """ sorted samples """
+    if not samples:
+        return 0
+    rank = math.ceil(len(samples) * min(100, max(0, pct)) / 100)
+    return samples[max(0, rank - 1)]
@@ -0,0 +1,261 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Dual Root - opt in tracing and profiling of the sync daemon.
+
+Tracing:
+    Spans around the hot paths (event read and dispatch, sync requests,
+    rsync runs, program spawn and wait) are written as JSON lines:
+        {"name": "rsync", "ts": 1700000000.123, "dur": 0.52,
+         "thread": "dual-root-sync-0", "dest": "/efi1/", "retc": 0}
+    ts is wall clock start and dur is seconds taken.
+    Events without a duration (e.g. sync requests) have no dur.
+
+    Enabled by config trace_file or environment DUAL_ROOT_TRACE_FILE.
+    When disabled, trace_span() returns a shared do nothing span.
+    run_prog traces through _trace_hook, so it does not import this.
+
+Profiling:
+    With profile_dir set (or DUAL_ROOT_PROFILE_DIR), SIGUSR1 runs cProfile
+    for profile_secs seconds and saves the stats to
+        <profile_dir>/dual-root-<pid>-<time>.pstats
+    cProfile uses sys.monitoring, so all threads (incl sync workers)
+    are profiled.
+    View with: python -m pstats <file>
+"""
+from typing import (Any, IO)
+from types import FrameType
+import cProfile
+import json
+import os
+import signal
+import threading
+import time
+
+from ._trace_hook import (NullSpan, NULL_SPAN, set_span_func)
+
+ENV_TRACE_FILE = 'DUAL_ROOT_TRACE_FILE'
+ENV_PROFILE_DIR = 'DUAL_ROOT_PROFILE_DIR'
+
+
+class _Span:
+    """
+    One timed span - written when it ends.
+    """
+    def __init__(self, tracer: 'Tracer', name: str, attrs: dict[str, Any]):
+        self.tracer: 'Tracer' = tracer
+        self.attrs: dict[str, Any] = attrs
+        self.attrs['name'] = name
+        self.start: float = 0
+
+    def set(self, **attrs):
+        """ Add attributes (e.g. results) """
+        self.attrs.update(attrs)
+
+    def __enter__(self) -> '_Span':
+        self.attrs['ts'] = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, _exc_val, _exc_tb) -> None:
+        self.attrs['dur'] = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attrs['error'] = exc_type.__name__
+        self.tracer.write(self.attrs)
+
+
+class Tracer:
+    """
+    Writes spans to a JSON lines file (thread safe).
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._fobj: IO[str] | None = None
+        self.enabled: bool = False
+
+    def open(self, path: str) -> bool:
+        """
+        Start tracing to path (appended to).
+        """
+        self.close()
+        try:
+            fobj = open(path, 'a', encoding='utf-8', buffering=1)
+        except OSError as err:
+            print(f'Tracing disabled - cannot open {path}: {err}')
+            return False
+
+        with self._lock:
+            self._fobj = fobj
+            self.enabled = True
+        print(f'Tracing to {path}')
+        return True
+
+    def close(self):
+        """ Stop tracing """
+        with self._lock:
+            self.enabled = False
+            if self._fobj is not None:
+                self._fobj.close()
+                self._fobj = None
+
+    def write(self, record: dict[str, Any]):
+        """ Write one record """
+        record['thread'] = threading.current_thread().name
+        line = json.dumps(record, default=str)
+        with self._lock:
+            if self._fobj is None:
+                return
+            try:
+                self._fobj.write(line + '\n')
+            except OSError as err:
+                print(f'Tracing stopped - write failed: {err}')
+                self._fobj.close()
+                self._fobj = None
+                self.enabled = False
+
+
+TRACER = Tracer()
+
+
+def trace_span(name: str, **attrs) -> _Span | NullSpan:
+    """
+    Span to use as context manager:
+        with trace_span('rsync', dest=dest) as span:
+            ...
+            span.set(retc=retc)
+    """
+    if not TRACER.enabled:
+        return NULL_SPAN
+    return _Span(TRACER, name, attrs)
+
+
+def trace_event(name: str, **attrs):
+    """
+    Record something that happened (no duration).
+    """
+    if not TRACER.enabled:
+        return
+    attrs['name'] = name
+    attrs['ts'] = time.time()
+    TRACER.write(attrs)
+
+
+class Profiler:
+    """
+    cProfile for a window of time, started by SIGUSR1.
+
+    Args:
+        out_dir (str):
+            Where .pstats files are saved.
+
+        secs (float):
+            How long each profile runs.
+    """
+    def __init__(self, out_dir: str, secs: float = 60):
+        self.out_dir: str = out_dir
+        self.secs: float = max(1.0, secs)
+
+        self._lock = threading.Lock()
+        self._profile: cProfile.Profile | None = None
+        self._timer: threading.Timer | None = None
+
+    def install(self):
+        """ Start profile on SIGUSR1 """
+        signal.signal(signal.SIGUSR1, self._on_signal)
+        print(f'Profiling: kill -USR1 {os.getpid()} for {self.secs} secs'
+              f' -> {self.out_dir}')
+
+    def _on_signal(self, _sig_num: int, _sig_frame: FrameType | None):
+        """ signal handler - dont take locks here """
+        threading.Thread(target=self.start, name='dual-root-profile',
+                         daemon=True).start()
+
+    def start(self) -> bool:
+        """
+        Start profile window.
+
+        Returns:
+            bool: False if one is already running.
+        """
+        with self._lock:
+            if self._profile is not None:
+                return False
+
+            profile = cProfile.Profile()
+            try:
+                profile.enable()
+            except ValueError as err:
+                # another profiler active
+                print(f'Profile not started: {err}')
+                return False
+
+            self._profile = profile
+            self._timer = threading.Timer(self.secs, self.stop)
+            self._timer.daemon = True
+            self._timer.start()
+        return True
+
+    def stop(self) -> str:
+        """
+        End profile window and save stats.
+
+        Returns:
+            str: file saved to ('' if none).
+        """
+        with self._lock:
+            profile = self._profile
+            timer = self._timer
+            self._profile = None
+            self._timer = None
+
+        if profile is None:
+            return ''
+        profile.disable()
+        if timer is not None and timer is not threading.current_thread():
+            timer.cancel()
+
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.out_dir,
+                            f'dual-root-{os.getpid()}-{stamp}.pstats')
+        try:
+            os.makedirs(self.out_dir, exist_ok=True)
+            profile.dump_stats(path)
+        except OSError as err:
+            print(f'Failed to save profile {path}: {err}')
+            return ''
+
+        print(f'Profile saved to {path}')
+        return path
+
+
+def start_tracing(trace_file: str, profile_dir: str,
+                  profile_secs: float) -> Profiler | None:
+    """
+    Turn on whatever is asked for - environment overrides config.
+
+    Returns:
+        Profiler | None:
+        The profiler if SIGUSR1 profiling is on.
+    """
+    trace_file = os.environ.get(ENV_TRACE_FILE, trace_file)
+    profile_dir = os.environ.get(ENV_PROFILE_DIR, profile_dir)
+
+    if trace_file and TRACER.open(trace_file):
+        set_span_func(trace_span)
+
+    if not profile_dir:
+        return None
+
+    profiler = Profiler(profile_dir, profile_secs)
+    profiler.install()
+    return profiler
+
+
+def stop_tracing(profiler: Profiler | None):
+    """
+    Save any running profile and close trace file.
+    """
+    if profiler is not None:
+        profiler.stop()
+    set_span_func(None)
+    TRACER.close()
@@ -12,6 +12,17 @@ from subprocess import SubprocessError
 
 from .run_prog import run_prog
 
+# Directory holding the programs we run (efibootmgr, lsblk, mount, rsync,
+# inotifywait). Can be changed, e.g. to use stand ins for benchmarks.
+TOOL_DIR = '/usr/bin'
+
+
+def tool_path(name: str) -> str:
+    """
+    Full path of program name - see TOOL_DIR
+    """
+    return os.path.join(TOOL_DIR, name)
+
 
 def os_scandir(tdir: str) -> Iterator[os.DirEntry] | None:
     """
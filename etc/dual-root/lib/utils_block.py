@@ -3,8 +3,13 @@
 """
   Dual Root Support Utils
 """
+import errno
 import os
-from .utils import run_cmd
+from .utils import (run_cmd, tool_path)
+from .run_prog import run_prog
+from .mount_native import mount_bind
+from .block_index import block_index
+from .efivars import (booted_esp_partuuid_efivars, EFIVARS_DIR)
 
 
 def device_to_uuid_mounts(dev: str) -> tuple[str, list[str]]:
@@ -21,33 +26,37 @@ def device_to_uuid_mounts(dev: str) -> tuple[str, list[str]]:
     if not dev:
         return (uuid, mounts)
 
-    pargs = ['/usr/bin/lsblk', '-no', 'UUID,MOUNTPOINTS', dev]
-    result_lines = run_cmd(pargs)
+    index = block_index()
+    uuid = index.uuid_of_device(dev)
+    mounts = index.mounts_of_device(dev)
 
-    if not result_lines:
+    if not uuid:
         print(f'Failed to find uuid of {dev}')
-        return (uuid, mounts)
-
-    for line in result_lines:
-        item = line.split()
-        if len(item) > 1:
-            uuid = item[0]
-            mount = item[1]
-        else:
-            mount = item[0]
-        mounts.append(mount)
 
     return (uuid, mounts)
 
 
-def booted_esp_partuuid() -> str:
+def booted_esp_partuuid(efivars_dir: str = EFIVARS_DIR) -> str:
+    """
+    Identify partuuid of currently booted esp
+     - Read from efivarfs (efivars_dir)
+     - If that fails, run efibootmgr to get partuuid
+    """
+    partuuid = booted_esp_partuuid_efivars(efivars_dir)
+    if partuuid:
+        return partuuid
+
+    return _booted_esp_partuuid_efibootmgr()
+
+
+def _booted_esp_partuuid_efibootmgr() -> str:
     """
     Identify partuuid of currently booted esp
      - Run efibootmgr to get partuuid
     """
     partuuid = ''
 
-    pargs = ['/usr/bin/efibootmgr']
+    pargs = [tool_path('efibootmgr')]
     result_lines = run_cmd(pargs)
     if not result_lines:
         print('Failed to run efibootmgr')
@@ -104,13 +113,7 @@ def partuuid_to_device(partuuid: str) -> str:
         str:
         /dev/device_name
     """
-    device = ''
-    by_puid_path = f'/dev/disk/by-partuuid/{partuuid}'
-    if os.path.islink(by_puid_path):
-        device = os.readlink(by_puid_path)
-        device = os.path.basename(device)
-        device = f'/dev/{device}'
-    return device
+    return block_index().device_of_partuuid(partuuid)
 
 
 def mount_to_uuid(mount_dir: str) -> str:
@@ -121,36 +124,115 @@ def mount_to_uuid(mount_dir: str) -> str:
     if not mount_dir:
         return uuid
 
-    pargs = ['/usr/bin/lsblk', '-lno', 'UUID,MOUNTPOINTS']
-    result_lines = run_cmd(pargs)
-
-    if not result_lines:
+    index = block_index()
+    if not index.mount_dev:
         print(f'Failed to find any uuid of {mount_dir}')
         return uuid
 
-    for item in result_lines:
-        items = item.split()
-        if len(items) > 1:
-            (this_uuid, this_mount) = items
-            if this_mount == mount_dir:
-                uuid = this_uuid
-                break
-    return uuid
+    return index.uuid_of_mount(mount_dir)
 
 
-def bind_mount(src_dir: str, dest_dir: str):
+def bind_mount(src_dir: str, dest_dir: str) -> bool:
     """
     Bind mount src_dir onto dest_dir
      - must be root
-     - does not check if dest_dir mounted already
      - NB os.path.ismount(path) is not reliable for bind mounts on same filesys
-       So we don't use this to check if already mounted. Caller
-       checks (see is_efi_mounted() method)
-    """
-    okay = True
-    pargs = ['/usr/bin/mount', '--bind', src_dir, dest_dir]
-    result = run_cmd(pargs)
-    if not result:
-        print(f'Bind Mount failed {src_dir} -> {dest_dir}')
-        return not okay
-    return okay
+       So instead the mount index (/proc/self/mountinfo) is checked.
+       If dest_dir is a mount point and is the same directory as src_dir
+       there is nothing to do. If something else is mounted there,
+       it is left alone.
+     - Uses mount(2) directly, falling back to /usr/bin/mount
+       if that is not available.
+
+    Returns:
+        bool:
+        True if dest_dir has src_dir bind mounted.
+    """
+    dest_dev = block_index(refresh=True).device_of_mount(dest_dir)
+    if dest_dev:
+        if _same_dir(src_dir, dest_dir):
+            print(f'Bind mount {src_dir} already on {dest_dir}')
+            return True
+        print(f'Bind mount skipped: {dest_dir} has {dest_dev} mounted')
+        return False
+
+    try:
+        mount_bind(src_dir, dest_dir)
+        block_index(refresh=True)
+        return True
+
+    except OSError as err:
+        if err.errno not in (None, errno.ENOSYS):
+            print(f'Bind Mount failed {src_dir} -> {dest_dir}: {err}')
+            return False
+
+    # fallback - mount program
+    (ret, _out, err_txt) = run_prog([tool_path('mount'), '--bind',
+                                     src_dir, dest_dir])
+    if ret != 0:
+        print(f'Bind Mount failed {src_dir} -> {dest_dir}: {err_txt}')
+        return False
+
+    block_index(refresh=True)
+    return True
+
+
+def _same_dir(dir1: str, dir2: str) -> bool:
+    """ True if both are the same directory (e.g. one bind mounted on other) """
+    try:
+        stat1 = os.stat(dir1)
+        stat2 = os.stat(dir2)
+    except OSError:
+        return False
+    return (stat1.st_dev, stat1.st_ino) == (stat2.st_dev, stat2.st_ino)
+
+
+def path_to_disks(path: str) -> list[str]:
+    """
+    Physical disk(s) holding the filesystem containing path.
+
+    Uses /sys/dev/block to map the filesystem device to its disk.
+    Partitions map to their parent disk and device mapper / md
+    devices to the disks underneath them.
+
+    Returns:
+        list[str]:
+        sorted disk names (e.g. ['nvme0n1']) or if unknown
+        (e.g. btrfs anonymous device) the "major:minor" of the filesystem.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return [path]
+
+    majmin = f'{os.major(stat.st_dev)}:{os.minor(stat.st_dev)}'
+    sys_path = f'/sys/dev/block/{majmin}'
+    if not os.path.exists(sys_path):
+        return [majmin]
+
+    disks = _sys_block_disks(os.path.realpath(sys_path))
+    if not disks:
+        return [majmin]
+    return sorted(disks)
+
+
+def _sys_block_disks(sys_path: str) -> set[str]:
+    """
+    Disk names for a /sys/devices/.../block/xxx device path.
+    """
+    if os.path.exists(os.path.join(sys_path, 'partition')):
+        return {os.path.basename(os.path.dirname(sys_path))}
+
+    slaves_dir = os.path.join(sys_path, 'slaves')
+    slaves: list[str] = []
+    if os.path.isdir(slaves_dir):
+        slaves = os.listdir(slaves_dir)
+
+    if not slaves:
+        return {os.path.basename(sys_path)}
+
+    disks: set[str] = set()
+    for slave in slaves:
+        slave_path = os.path.realpath(os.path.join(slaves_dir, slave))
+        disks |= _sys_block_disks(slave_path)
+    return disks
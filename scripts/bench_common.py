@@ -0,0 +1,136 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Shared by the benchmarks (bench-sync, bench-storm).
+
+Set up and run the sync daemon code in process against synthetic
+trees: lib path, where trees go, stand in tool directory, a Sync from
+a daemon config file and the inotify event loop.
+"""
+# pylint: disable=import-outside-toplevel
+from typing import (Any)
+from collections.abc import (Callable)
+import json
+import os
+import resource
+import shutil
+import sys
+import threading
+
+
+def use_lib(lib_dir: str) -> bool:
+    """
+    Import lib from lib_dir (the tree being measured).
+    """
+    lib_dir = os.path.abspath(lib_dir)
+    if not os.path.isdir(os.path.join(lib_dir, 'lib')):
+        print(f'No lib/ in {lib_dir}', file=sys.stderr)
+        return False
+    sys.path.insert(0, lib_dir)
+    return True
+
+
+def tmp_dir(arg: str) -> str | None:
+    """
+    Where to build trees: arg if given, else tmpfs if available
+    (None is the system default).
+    """
+    if arg:
+        return arg
+    return '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+
+def write_exec(path: str, text: str):
+    """ write executable script """
+    with open(path, 'w', encoding='utf-8') as fobj:
+        fobj.write(text)
+    os.chmod(path, 0o755)
+
+
+def make_tool_dir(tool_dir: str, fakes: dict[str, str] | None = None
+                  ) -> bool:
+    """
+    Programs used by the daemon, and have lib use them (utils.TOOL_DIR).
+     - fakes: stand in scripts (name -> content)
+     - rsync and inotifywait are the real ones
+    """
+    os.makedirs(tool_dir, exist_ok=True)
+    for (name, text) in (fakes or {}).items():
+        write_exec(os.path.join(tool_dir, name), text)
+
+    okay = True
+    for prog in ('rsync', 'inotifywait'):
+        real = shutil.which(prog)
+        if real:
+            os.symlink(real, os.path.join(tool_dir, prog))
+        elif prog == 'rsync':
+            print('rsync not found', file=sys.stderr)
+            okay = False
+
+    from lib import utils
+    utils.TOOL_DIR = tool_dir
+    return okay
+
+
+def make_sync(top: str, src: str, dest: str, settings: dict[str, Any]):
+    """
+    Sync for one item: src -> dest (via daemon config file)
+     - settings: config values, e.g. {'sync_delay': 1}
+    """
+    from lib.config import Config
+    from lib._sync import Sync
+
+    conf_file = os.path.join(top, 'sync-daemon.conf')
+    with open(conf_file, 'w', encoding='utf-8') as fobj:
+        for (key, val) in settings.items():
+            fobj.write(f'{key} = {json.dumps(val)}\n')
+        fobj.write('full_sync_interval = 0\n'
+                   f'sync = [["{src}/", ["{dest}/"]]]\n')
+
+    argv = sys.argv
+    sys.argv = [argv[0], '--syncd', '--quiet', '--conf', conf_file]
+    try:
+        conf = Config()
+    finally:
+        sys.argv = argv
+    return Sync(conf)
+
+
+def cpu_secs() -> tuple[float, float]:
+    """ (self, children) user + sys cpu seconds """
+    own = resource.getrusage(resource.RUSAGE_SELF)
+    kids = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return (own.ru_utime + own.ru_stime, kids.ru_utime + kids.ru_stime)
+
+
+def run_daemon(sync, driver: Callable[[], None]
+               ) -> tuple[Any, tuple[float, float]]:
+    """
+    Daemon event loop for the first sync item in this (main) thread,
+    while driver() makes changes from another. Stops when driver
+    returns, then completes any pending syncs.
+
+    Returns:
+        tuple[Inotify, tuple[float, float]]:
+        (inotify, (self, children) cpu seconds used by the event loop)
+    """
+    from lib import class_inotify
+    from lib.class_inotify import Inotify
+
+    inotify = Inotify(backend=sync.inotify_backend)
+    sync.inotify = inotify
+    inotify.add_watch_item(sync.sync_items[0])
+    inotify.popen_inotify()
+
+    def run():
+        driver()
+        class_inotify.inotify_signal_handler(0, None)
+
+    thread = threading.Thread(target=run, daemon=True)
+    (cpu0, kids0) = cpu_secs()
+    thread.start()
+    inotify.event_handler()
+    thread.join()
+    (cpu1, kids1) = cpu_secs()
+    sync.scheduler.shutdown(drain=True)
+    return (inotify, (cpu1 - cpu0, kids1 - kids0))
@@ -0,0 +1,60 @@
+# SPDX-License-Identifier: MIT
+# SPDX-FileCopyrightText: © 2023-present  Gene C <arch@sapience.com>
+"""
+Tests for rsync_tools.files_from_list()
+
+Run from top level of repo:  python -m pytest tests
+"""
+# pylint: disable=wrong-import-position
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..',
+                                'etc', 'dual-root'))
+
+from lib.rsync_tools import files_from_list
+
+
+def _paths(files_from: str | None) -> list[str] | None:
+    """ --files-from list back to paths """
+    if files_from is None:
+        return None
+    return [path for path in files_from.split('\0') if path]
+
+
+def test_contents_of_dir():
+    """ src with trailing / copies its contents """
+    got = files_from_list('/efi0/', ['/efi0/EFI/x', '/efi0/loader.conf'])
+    assert _paths(got) == ['EFI/x', 'loader.conf']
+
+
+def test_dir_itself():
+    """ src without trailing / is relative to its parent """
+    got = files_from_list('/etc', ['/etc/fstab', '/etc/ssh/sshd_config'])
+    assert _paths(got) == ['etc/fstab', 'etc/ssh/sshd_config']
+
+
+def test_top_means_full_sync():
+    """ change to top of source """
+    assert files_from_list('/efi0/', ['/efi0/x', '/efi0']) is None
+    assert files_from_list('/etc', ['/etc/']) is None
+
+
+def test_dot_dot_names_kept():
+    """ names starting with '..' are real files """
+    got = files_from_list('/efi0/', ['/efi0/..foo', '/efi0/a/..bar'])
+    assert _paths(got) == ['..foo', 'a/..bar']
+
+
+def test_outside_source_dropped():
+    """ only paths in the source tree """
+    got = files_from_list('/etc', ['/usr/x', '/etcx/y', '/etc/a'])
+    assert _paths(got) == ['etc/a']
+
+    assert files_from_list('/efi0/', ['/efi1/x', '/efi0x']) == ''
+
+
+def test_root_source():
+    """ everything is under / """
+    got = files_from_list('/', ['/usr/x', '/..foo'])
+    assert _paths(got) == ['usr/x', '..foo']